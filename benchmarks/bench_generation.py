@@ -0,0 +1,244 @@
+"""
+Benchmarks for project generation.
+
+Generates synthetic projects with 1 to 10,000 scheduled tasks, each with one
+to several container deployments, and times `Project.copy_files`,
+`Project.make_files` and the `dump` of every `FileBase` subtype in a
+temporary directory. Peak memory of `make_files` is measured in a separate
+run with tracemalloc, so that tracing does not distort the timings.
+
+    $ python benchmarks/bench_generation.py --sizes 1 10 100
+    $ python benchmarks/bench_generation.py --save-baseline
+
+Results are compared with `benchmarks/baseline.json`. The number of
+generated files must match exactly, otherwise the script exits with status 1.
+Timings are scaled by a calibration run, so that a baseline recorded on
+another machine still applies, and a timing more than `--tolerance` above its
+baseline is reported as a warning, or with `--strict` as a failure.
+`--save-baseline` replaces the baseline with the sizes of the current run.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import List, Tuple
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fargatebootstrap.project import Project  # noqa: E402
+from fargatebootstrap.projectdata import (  # noqa: E402
+    ContainerDeployment,
+    DockerbuildPipeline,
+    DockerImage,
+    EcsScheduledTask,
+    ProjectConfig,
+)
+
+SIZES = [1, 10, 100, 1000, 10000]
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def synthetic_project(n_tasks: int, max_containers: int = 3) -> Project:
+    """
+    `n_tasks` tasks with 1 to `max_containers` deployments each. Every task
+    also runs an image shared by all tasks, like a sidecar.
+    """
+    config = ProjectConfig(
+        account_id="123456789012",
+        region="ap-northeast-1",
+        vpc_name="vpc_bench",
+        ecs_cluster_name="bench-cluster",
+        git_repo_name="bench",
+        git_repo_branch="master",
+    )
+    pipeline = DockerbuildPipeline(
+        unittest_subnets=("subnet1",), unittest_security_groups=("sg1",)
+    )
+
+    def image(name):
+        return DockerImage(
+            name=name,
+            environment="production",
+            description=f"Runs {name}",
+            script_name="main",
+            ecr_endpoint=config.ecr_endpoint,
+        )
+
+    shared = image("shared")
+    tasks = []
+    for i in range(n_tasks):
+        name = f"task{i}"
+        images = [image(f"{name}_{j}") for j in range(i % max_containers)] + [shared]
+        tasks.append(
+            EcsScheduledTask(
+                name=name,
+                environment="production",
+                cpu=512,
+                memory=2048,
+                region=config.region,
+                container_deployments=tuple(
+                    ContainerDeployment(task_name=name, image=img) for img in images
+                ),
+                subnets=("subnet1", "subnet2"),
+                security_groups=("sg1",),
+                schedule_expression="rate(1 hour)",
+                pipeline=pipeline,
+            )
+        )
+    return Project(config=config, tasks=tuple(tasks))
+
+
+@contextmanager
+def quiet():
+    """
+    The generator prints a line per file
+    """
+    stdout = sys.stdout
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+@contextmanager
+def in_tempdir():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            yield tmp
+        finally:
+            os.chdir(cwd)
+
+
+def timed(f) -> float:
+    gc.collect()
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def calibrate(repeat: int = 5) -> float:
+    """
+    Best time of a fixed YAML dump, the kind of work that dominates generation
+    """
+    document = {
+        f"phase{i}": {"commands": [f"echo {i} {j}" for j in range(20)]}
+        for i in range(50)
+    }
+    return min(
+        timed(lambda: yaml.dump(document, default_flow_style=False))
+        for _ in range(repeat)
+    )
+
+
+def bench_size(n_tasks: int, max_containers: int) -> dict:
+    project = synthetic_project(n_tasks, max_containers)
+    result = {}
+    with quiet(), in_tempdir():
+        result["copy_files"] = timed(project.copy_files)
+        result["make_files"] = timed(project.make_files)
+
+    dump_seconds = defaultdict(float)
+    files = project.output_graph().order()
+    for file in files:
+        start = time.perf_counter()
+        file.dump()
+        dump_seconds[type(file).__name__] += time.perf_counter() - start
+    result["files"] = len(files)
+    result.update({f"dump.{name}": seconds for name, seconds in dump_seconds.items()})
+
+    with quiet(), in_tempdir():
+        tracemalloc.start()
+        project.make_files()
+        result["make_files.peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result
+
+
+def compare(
+    results: dict, baseline: dict, tolerance: float, calibration: float
+) -> Tuple[List[str], List[str]]:
+    """
+    Errors for file counts that differ from the baseline, and warnings for
+    timings that are more than `tolerance` above it after scaling by the
+    calibration of both runs
+    """
+    errors, warnings = [], []
+    scale = baseline.get("calibration", calibration) / calibration
+    for size, metrics in results.items():
+        reference = baseline.get(size)
+        if reference is None:
+            continue
+        if metrics["files"] != reference["files"]:
+            errors.append(
+                f"{size} tasks: {metrics['files']} files vs {reference['files']}"
+            )
+        for metric, value in metrics.items():
+            if metric == "files" or not reference.get(metric):
+                continue
+            # memory does not depend on the speed of the machine
+            if not metric.endswith("peak_mb"):
+                value *= scale
+            # ignore noise on very small numbers
+            if value > reference[metric] * (1 + tolerance) and value > 0.01:
+                warnings.append(
+                    f"{size} tasks, {metric}: {value:.3f} vs {reference[metric]:.3f}"
+                )
+    return errors, warnings
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument(
+        "--containers", type=int, default=3, help="max containers per task"
+    )
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument(
+        "--strict", action="store_true", help="exit with status 1 on slower timings"
+    )
+    args = parser.parse_args(argv)
+
+    calibration = calibrate()
+    results = {}
+    for size in args.sizes:
+        results[str(size)] = metrics = bench_size(size, args.containers)
+        print(f"{size} tasks, {metrics['files']} files")
+        for metric, value in sorted(metrics.items()):
+            if metric != "files":
+                print(f"  {metric:<40} {value:10.4f}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.save_baseline:
+        baseline = dict(results, calibration=calibration)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    errors, warnings = compare(results, baseline, args.tolerance, calibration)
+    for warning in warnings:
+        print(f"{'REGRESSION' if args.strict else 'WARNING'} {warning}")
+    for error in errors:
+        print(f"REGRESSION {error}")
+    return 1 if errors or (args.strict and warnings) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
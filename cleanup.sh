@@ -4,3 +4,5 @@ rm -rf terraform
 rm -rf buildspec
 rm docker-compose*
 rm Makefile
+rm .fargatebootstrap-manifest.json
+rm -rf .fargatebootstrap-build
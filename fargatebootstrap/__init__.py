@@ -1 +1,25 @@
-from . import projectdata, projectfiles, project, templates
+import importlib
+
+# Submodules are imported on first access, so that e.g. the command line
+# interface does not pay for jinja2 and yaml when it does not need them.
+__all__ = [
+    "projectdata",
+    "projectfiles",
+    "project",
+    "templates",
+    "manifest",
+    "engine",
+    "outputgraph",
+    "build",
+    "spec",
+    "cli",
+    "instrumentation",
+    "sizing",
+    "runner",
+]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
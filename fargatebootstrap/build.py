@@ -0,0 +1,264 @@
+import json
+import os
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Tuple
+
+from .manifest import content_hash, file_hash
+from .projectdata import BaseImage
+
+BUILT = "built"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+# BuildKit for the cache mounts of the optimized Dockerfiles and for the
+# per-image .dockerignore files
+BUILD_COMMAND = "DOCKER_BUILDKIT=1 docker build -f {dockerfile} {tags} {context}"
+LOCK_COMMAND = "cd {folder} && pipenv lock"
+
+
+@dataclass
+class BuildJob:
+    """
+    A shell command that produces one artifact, e.g. a Docker image.
+    `inputs` are files or folders; when their content and the command are the
+    same as in the last successful run, the job is skipped. It is not skipped
+    while one of the files in `outputs` is missing.
+    """
+
+    name: str
+    command: str
+    inputs: Tuple[str, ...] = ()
+    depends_on: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+
+    def digest(self) -> str:
+        parts = [self.command]
+        for path in sorted(self.inputs):
+            if os.path.isdir(path):
+                for dirpath, dirnames, filenames in os.walk(path):
+                    dirnames[:] = sorted(d for d in dirnames if d != "__pycache__")
+                    for filename in sorted(filenames):
+                        filepath = os.path.join(dirpath, filename)
+                        parts.append(f"{filepath}:{file_hash(filepath)}")
+            elif os.path.exists(path):
+                parts.append(f"{path}:{file_hash(path)}")
+            else:
+                parts.append(f"{path}:missing")
+        return content_hash("\n".join(parts))
+
+
+@dataclass
+class BuildResult:
+    name: str
+    status: str
+    seconds: float = 0.0
+    returncode: int = 0
+    command: str = ""
+    log: str = ""
+
+
+class BuildOrchestrator:
+    """
+    Runs build jobs in a thread pool of `max_workers`.
+
+    A job starts as soon as the jobs it depends on have finished. It is
+    skipped when its inputs did not change since its last successful build
+    and none of its dependencies were rebuilt. Jobs whose dependencies failed
+    are not run.
+
+    The hashes of successful builds are kept in `state_dir`, together with one
+    log file per job and `report.json` with the timing of the last run.
+    """
+
+    def __init__(
+        self,
+        jobs: List[BuildJob],
+        max_workers: int = 4,
+        state_dir: str = ".fargatebootstrap-build",
+    ):
+        self.jobs = {job.name: job for job in jobs}
+        self.max_workers = max_workers
+        self.state_dir = state_dir
+        self.state_path = os.path.join(state_dir, "state.json")
+        self.report_path = os.path.join(state_dir, "report.json")
+        self.state = self._load_state()
+
+    def _load_state(self) -> Dict[str, str]:
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def _run_job(self, job: BuildJob) -> BuildResult:
+        log = os.path.join(self.state_dir, "logs", f"{job.name}.log")
+        print(f"Building {job.name}")
+        start = time.perf_counter()
+        with open(log, "w") as f:
+            process = subprocess.run(
+                job.command, shell=True, stdout=f, stderr=subprocess.STDOUT
+            )
+        seconds = time.perf_counter() - start
+        status = BUILT if process.returncode == 0 else FAILED
+        print(f"{job.name} {status} in {seconds:.1f}s")
+        return BuildResult(
+            name=job.name,
+            status=status,
+            seconds=seconds,
+            returncode=process.returncode,
+            command=job.command,
+            log=log,
+        )
+
+    def _ready(self, job: BuildJob, results: Dict[str, BuildResult]) -> bool:
+        return all(
+            dependency in results
+            for dependency in job.depends_on
+            if dependency in self.jobs
+        )
+
+    def run(self) -> List[BuildResult]:
+        os.makedirs(os.path.join(self.state_dir, "logs"), exist_ok=True)
+        pending = dict(self.jobs)
+        results, digests, running = {}, {}, {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name, job in list(pending.items()):
+                    if not self._ready(job, results):
+                        continue
+                    del pending[name]
+                    dependencies = [
+                        results[d] for d in job.depends_on if d in self.jobs
+                    ]
+                    if any(r.status == FAILED for r in dependencies):
+                        print(f"Not building {name}, a dependency failed")
+                        results[name] = BuildResult(name, FAILED, command=job.command)
+                        continue
+                    digests[name] = job.digest()
+                    if (
+                        self.state.get(name) == digests[name]
+                        and not any(r.status == BUILT for r in dependencies)
+                        and all(os.path.exists(path) for path in job.outputs)
+                    ):
+                        print(f"{name} is up to date")
+                        results[name] = BuildResult(name, SKIPPED, command=job.command)
+                        continue
+                    running[pool.submit(self._run_job, job)] = name
+
+                if not running:
+                    if pending:
+                        raise ValueError(
+                            f"Unresolvable build dependencies: {', '.join(pending)}"
+                        )
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    if results[name].status == BUILT:
+                        # inputs are hashed before the build, so that files
+                        # written by the build itself don't count as changes
+                        self.state[name] = digests[name]
+                    else:
+                        self.state.pop(name, None)
+
+        ordered = [results[name] for name in self.jobs]
+        with open(self.state_path, "w") as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        with open(self.report_path, "w") as f:
+            json.dump([asdict(result) for result in ordered], f, indent=2)
+        print(self.summary(ordered))
+        return ordered
+
+    @staticmethod
+    def summary(results: List[BuildResult]) -> str:
+        width = max([len(result.name) for result in results] + [3])
+        lines = [f"{'job':<{width}}  {'status':<7}  seconds"]
+        for result in results:
+            lines.append(
+                f"{result.name:<{width}}  {result.status:<7}  {result.seconds:7.1f}"
+            )
+        return "\n".join(lines)
+
+
+def image_build_jobs(
+    images: Dict[str, list],
+    containers_dir: str = "containers",
+    build_command: str = BUILD_COMMAND,
+    base_image: BaseImage = None,
+    locked: bool = False,
+) -> List[BuildJob]:
+    """
+    One job per image name. `build_command` is formatted with the image `name`,
+    its `dockerfile`, the build `context` and the `tags` of all images sharing
+    the name. Pass e.g. `echo {name}` to test the orchestration without Docker.
+    The command must only build its own image: the ordering is up to the
+    orchestrator, so e.g. `make build_{name}` would rebuild the base image in
+    every job that uses it.
+
+    With a `base_image`, it is built first and the images that use it wait for it.
+    With `locked`, every image waits for its job from `lock_jobs`.
+    """
+    jobs = []
+    modules = os.path.join(containers_dir, "modules")
+
+    def job(name, same_name, depends_on=()):
+        if locked:
+            depends_on += (f"lock_{name}",)
+        dockerfile = os.path.join(containers_dir, same_name[0].filename)
+        command = build_command.format(
+            name=name,
+            dockerfile=dockerfile,
+            context=containers_dir,
+            tags=" ".join(f"-t {image.uri}" for image in same_name),
+        )
+        return BuildJob(
+            name=name,
+            command=command,
+            inputs=(
+                dockerfile,
+                f"{dockerfile}.dockerignore",
+                os.path.join(containers_dir, name),
+                modules,
+            ),
+            depends_on=depends_on,
+        )
+
+    if base_image is not None:
+        jobs.append(job(base_image.name, [base_image]))
+    for name, same_name in images.items():
+        uses_base = base_image is not None and same_name[0].uses_base_image
+        jobs.append(job(name, same_name, (base_image.name,) if uses_base else ()))
+    return jobs
+
+
+def lock_jobs(
+    images: Dict[str, list],
+    containers_dir: str = "containers",
+    lock_command: str = LOCK_COMMAND,
+    base_image: BaseImage = None,
+) -> List[BuildJob]:
+    """
+    One job per Pipfile, named `lock_<name>`, even when the image is used by
+    several tasks. `lock_command` is formatted with the image `name` and the
+    `folder` of its Pipfile.
+
+    A lock is skipped while its Pipfile has the content it had at the last
+    successful lock and the Pipfile.lock exists.
+    """
+    names = ([base_image.name] if base_image is not None else []) + list(images)
+    jobs = []
+    for name in names:
+        folder = os.path.join(containers_dir, name)
+        jobs.append(
+            BuildJob(
+                name=f"lock_{name}",
+                command=lock_command.format(name=name, folder=folder),
+                inputs=(os.path.join(folder, "Pipfile"),),
+                outputs=(os.path.join(folder, "Pipfile.lock"),),
+            )
+        )
+    return jobs
@@ -0,0 +1,218 @@
+"""
+Command line interface, e.g.
+
+    $ python -m fargatebootstrap plan --check
+
+Only argparse and the build defaults are imported up front. The generator
+and its dependencies are imported by the subcommand that needs them, so that
+`--help` returns quickly.
+"""
+import argparse
+import sys
+
+DEFAULT_SPEC = "fargatebootstrap.yml"
+
+
+def bootstrap(args) -> int:
+    from .spec import load_project
+
+    # options that are not given on the command line come from the spec
+    options = {
+        name: getattr(args, name)
+        for name in ["incremental", "workers", "executor"]
+        if getattr(args, name) is not None
+    }
+    project = load_project(args.spec, **options)
+    if args.profile is None:
+        project.bootstrap()
+        return 0
+
+    from .instrumentation import collect
+
+    with collect() as stats:
+        project.bootstrap()
+    stats.write(args.profile)
+    print(f"Wrote generation profile to {args.profile}")
+    return 0
+
+
+def plan(args) -> int:
+    from .spec import load_project
+
+    report = load_project(args.spec).plan()
+    print(report.summary())
+    if args.check and (report.added or report.changed or report.removed):
+        return 1
+    return 0
+
+
+def build(args) -> int:
+    from .spec import load_project
+
+    load_project(args.spec).build(
+        max_workers=args.max_workers,
+        build_command=args.build_command,
+        lock_command=args.lock_command,
+    )
+    return 0
+
+
+def provision(args) -> int:
+    from .spec import load_project
+
+    load_project(args.spec).provision()
+    return 0
+
+
+def rightsize(args) -> int:
+    from .sizing import read_usage, recommend, rewrite_spec
+    from .spec import load_project
+
+    project = load_project(args.spec, check_sizes=False)
+    recommendations = recommend(
+        project.tasks, read_usage(args.usage), args.headroom, args.percentile
+    )
+    for recommendation in recommendations:
+        print(recommendation.summary())
+    if args.write:
+        changed = rewrite_spec(args.spec, recommendations)
+        print(f"Resized {changed} task(s) in {args.spec}")
+    return 1 if any(r.problem for r in recommendations) and not args.write else 0
+
+
+def run(args) -> int:
+    from .runner import append_usage, run_task
+    from .spec import load_project
+
+    tasks = [
+        task
+        for task in load_project(args.spec).tasks
+        if task.name == args.task
+        and (args.environment is None or task.environment == args.environment)
+    ]
+    if len(tasks) != 1:
+        print(f"Expected one task {args.task}, found {len(tasks)}, use --environment")
+        return 2
+    results = []
+    for _ in range(args.repeat):
+        results.append(run_task(tasks[0], image=args.image))
+    for result in results:
+        print(result.summary())
+    if args.usage:
+        append_usage(args.usage, results)
+        print(f"Appended {len(results)} run(s) to {args.usage}")
+    return 1 if any(result.returncode for result in results) else 0
+
+
+def make_parser() -> argparse.ArgumentParser:
+    from .build import BUILD_COMMAND, LOCK_COMMAND
+
+    parser = argparse.ArgumentParser(
+        prog="fargatebootstrap",
+        description="Bootstrap projects running in AWS ECS Fargate",
+    )
+    parser.add_argument(
+        "--spec",
+        default=DEFAULT_SPEC,
+        help=f"YAML or JSON project spec (default: {DEFAULT_SPEC})",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    subparsers.required = True
+
+    p = subparsers.add_parser("bootstrap", help="generate the project files")
+    p.add_argument(
+        "--incremental",
+        action="store_true",
+        default=None,
+        help="only write files whose content changed",
+    )
+    p.add_argument("--workers", type=int, help="files rendered concurrently")
+    p.add_argument("--executor", choices=["thread", "process"])
+    p.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="write the time and size of every file to a .json or .csv report",
+    )
+    p.set_defaults(func=bootstrap)
+
+    p = subparsers.add_parser(
+        "plan", help="show which files bootstrap would add, change or remove"
+    )
+    p.add_argument(
+        "--check",
+        action="store_true",
+        help="exit with status 1 if any file is out of date",
+    )
+    p.set_defaults(func=plan)
+
+    p = subparsers.add_parser("build", help="lock dependencies and build the images")
+    p.add_argument("--max-workers", type=int, default=4)
+    p.add_argument(
+        "--build-command",
+        default=BUILD_COMMAND,
+        help="command per image, formatted with "
+        "{name}, {dockerfile}, {context} and {tags}",
+    )
+    p.add_argument(
+        "--lock-command",
+        default=LOCK_COMMAND,
+        help="command per Pipfile, formatted with {name} and {folder}",
+    )
+    p.set_defaults(func=build)
+
+    p = subparsers.add_parser(
+        "rightsize", help="recommend task cpu and memory from recorded usage"
+    )
+    p.add_argument(
+        "--usage",
+        required=True,
+        metavar="PATH",
+        help="CSV or JSON with task, environment, peak_cpu and peak_memory per run",
+    )
+    p.add_argument(
+        "--headroom", type=float, default=0.2, help="fraction added to the peaks"
+    )
+    p.add_argument(
+        "--percentile",
+        type=float,
+        default=100,
+        help="percentile of the peaks of all runs to size for (default: max)",
+    )
+    p.add_argument(
+        "--write", action="store_true", help="write the recommended sizes to the spec"
+    )
+    p.set_defaults(func=rightsize)
+
+    p = subparsers.add_parser(
+        "run", help="run the scripts of a task locally, with its cpu and memory"
+    )
+    p.add_argument("task")
+    p.add_argument("--environment")
+    p.add_argument("--image", help="only run the container of this image")
+    p.add_argument("--repeat", type=int, default=1)
+    p.add_argument(
+        "--usage", metavar="PATH", help="append the results to this usage CSV"
+    )
+    p.set_defaults(func=run)
+
+    p = subparsers.add_parser("provision", help="terraform init and apply")
+    p.set_defaults(func=provision)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = make_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except ValueError as e:
+        # imported here, so that --help does not import the generator
+        from .spec import SpecError
+
+        if not isinstance(e, SpecError):
+            raise
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, List
+
+from .projectfiles import FileBase
+from .templates import loader
+
+
+def _dump(file: FileBase) -> str:
+    return file.dump()
+
+
+def _write_batch(write: Callable, batch: List[tuple]):
+    for file, dumped in batch:
+        write(file, dumped)
+
+
+def _write(file: FileBase, dumped: str):
+    file.write(dumped)
+
+
+def render_files(
+    files: List[FileBase], workers: int = 1, executor: str = "thread"
+) -> List[str]:
+    """
+    Dump every file, in the same order as `files`.
+
+    With more than one worker the files are rendered in a thread or process
+    pool. Rendering does not depend on the order, so the result is the same
+    as rendering them one by one. Worker processes use the same template
+    override folders, but their render stats are not collected.
+    """
+    if workers <= 1:
+        return [file.dump() for file in files]
+    chunksize = max(1, len(files) // (workers * 4))
+    if executor == "process":
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=loader.set_override_dirs,
+            initargs=(loader.override_dirs,),
+        )
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+    with pool:
+        return list(pool.map(_dump, files, chunksize=chunksize))
+
+
+def write_files(
+    files: List[FileBase],
+    rendered: List[str],
+    workers: int = 1,
+    batch_size: int = 64,
+    write: Callable = _write,
+):
+    """
+    Write rendered files to disk.
+
+    All output folders are created up front, then the files are written in
+    batches of `batch_size`, one batch per thread. `write` is called with
+    the file and its dumped content, and defaults to `FileBase.write`.
+    """
+    folders = {os.path.dirname(file.filepath) for file in files} - {""}
+    for folder in sorted(folders):
+        os.makedirs(folder, exist_ok=True)
+
+    pairs = list(zip(files, rendered))
+    if workers <= 1:
+        _write_batch(write, pairs)
+        return
+    batches = [pairs[i : i + batch_size] for i in range(0, len(pairs), batch_size)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # consume the iterator so that errors in a batch are raised here
+        list(pool.map(lambda batch: _write_batch(write, batch), batches))
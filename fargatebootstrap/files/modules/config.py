@@ -1,50 +1,113 @@
+import copy
 import os
+import pickle
+import sys
+from functools import lru_cache
 from os import environ
 from pprint import pprint
 
 import yaml
 
 RUNTIME_ENVIRONMENT = environ.get("RUNTIME_ENVIRONMENT")
-assert RUNTIME_ENVIRONMENT, "RUNTIME_ENVIRONMENT must be set!"
-print("*" * 100)
-print("RUNTIME ENVIRONMENT")
-print(RUNTIME_ENVIRONMENT)
-print("*" * 100)
+RUNTIME_ENVIRONMENTS = ["localhost", "docker_localhost", "staging", "production"]
 
-# Make sure that RUNTIME_ENVIRONMENT has a valid value
-assert RUNTIME_ENVIRONMENT in ["localhost", "docker_localhost", "staging", "production"]
+# libyaml is much faster than the pure python loader, when it is installed
+YamlLoader = getattr(yaml, "CLoader", yaml.Loader)
 
 
-def load_config(folder_name: str) -> None:
-    """
-    Inits the config read from the config.yml file in the folder specified by `folder_name`
-    """
-    # path = path.join(path.dirname(__file__), "config.yml")
-    # config_path = path.join("../", "zendishes", "config.yml")
-
-    config_path = os.path.join(
+def folder_path(folder_name: str) -> str:
+    return os.path.join(
         "/".join(os.path.abspath(__file__).split("/")[:-2]),  # pretty nasty
         folder_name,
-        "config.yml",
     )
 
+
+def snapshot_path(folder: str, environment: str) -> str:
+    return os.path.join(folder, f"config.{environment}.pickle")
+
+
+def merge_config(all_config: dict, environment: str) -> dict:
+    """
+    The config of `environment`, updated with the shared config
+    """
+    shared_config = all_config["shared"]
+    config = all_config[environment]
+
+    # make it possible to retrieve env name through config dict
+    config["env_name"] = environment
+
+    # update keys that also have values in shared config
+    for key, value in shared_config.items():
+        if key in config:
+            config[key].update(value)
+        else:
+            config[key] = value
+
+    # set release: conglomerate of version + environment
+    # release is used by sentry
+    config.update({"release": f"{config['version']}-{environment}"})
+    return config
+
+
+def read_yaml(config_path: str) -> dict:
     with open(config_path) as f:
-        all_config = yaml.load(f)
-        shared_config = all_config["shared"]
-        config = all_config[RUNTIME_ENVIRONMENT]
-
-        # make it possible to retrieve env name through config dict
-        config["env_name"] = RUNTIME_ENVIRONMENT
-
-        # update keys that also have values in shared config
-        for key, value in shared_config.items():
-            if key in config:
-                config[key].update(value)
-            else:
-                config[key] = value
-
-        # set release: conglomerate of version + environment
-        # release is used by sentry
-        config.update({"release": f"{config['version']}-{RUNTIME_ENVIRONMENT}"})
-    pprint(config)
+        return yaml.load(f, Loader=YamlLoader)
+
+
+@lru_cache(maxsize=None)
+def _load(folder_name: str, environment: str) -> dict:
+    folder = folder_path(folder_name)
+    config_path = os.path.join(folder, "config.yml")
+    snapshot = snapshot_path(folder, environment)
+    # a snapshot that is older than config.yml was not made from it
+    if os.path.exists(snapshot) and (
+        not os.path.exists(config_path)
+        or os.stat(snapshot).st_mtime >= os.stat(config_path).st_mtime
+    ):
+        with open(snapshot, "rb") as f:
+            return pickle.load(f)
+    return merge_config(read_yaml(config_path), environment)
+
+
+def load_config(folder_name: str, verbose: bool = False) -> dict:
+    """
+    Inits the config read from the config.yml file in the folder specified by `folder_name`.
+
+    The config is read once per process, from the snapshot made by
+    `make_snapshots` when there is one. Every call returns a copy.
+    """
+    assert RUNTIME_ENVIRONMENT, "RUNTIME_ENVIRONMENT must be set!"
+    # Make sure that RUNTIME_ENVIRONMENT has a valid value
+    assert RUNTIME_ENVIRONMENT in RUNTIME_ENVIRONMENTS
+
+    config = copy.deepcopy(_load(folder_name, RUNTIME_ENVIRONMENT))
+    if verbose:
+        pprint(config)
     return config
+
+
+def make_snapshots(folder: str):
+    """
+    Write the merged config of every environment in `folder/config.yml` to a
+    pickle next to it. Run when the image is built:
+
+        $ python -m services.modules.config services/my_image
+    """
+    config_path = os.path.join(folder, "config.yml")
+    if not os.path.exists(config_path):
+        print(f"No config in {folder}, no snapshots made")
+        return
+    all_config = read_yaml(config_path)
+    for environment in RUNTIME_ENVIRONMENTS:
+        if environment not in all_config:
+            continue
+        # merge_config changes the config it is given
+        config = merge_config(copy.deepcopy(all_config), environment)
+        with open(snapshot_path(folder, environment), "wb") as f:
+            pickle.dump(config, f)
+        print(f"Wrote config snapshot for {environment}")
+
+
+if __name__ == "__main__":
+    for folder in sys.argv[1:]:
+        make_snapshots(folder)
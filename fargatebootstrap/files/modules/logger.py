@@ -1,13 +1,17 @@
 import enum
+import json
 import logging
+import queue
 import sys
+import threading
+import time
 import traceback
-from functools import partial
+import urllib.request
+from collections import OrderedDict
 from logging import StreamHandler
 from typing import Dict, List
 
 import progressbar
-from slack_logger import SlackFormatter, SlackHandler
 
 
 class LoggerName(enum.Enum):
@@ -32,33 +36,280 @@ progressbar.streams.wrap_stderr()
 progressbar.streams.flush()
 
 
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a JSON object on one line. CloudWatch Logs Insights
+    discovers the fields of JSON log lines, so they can be queried without
+    `parse`. Attributes passed with `extra` become fields as well.
+    """
+
+    # attributes of every LogRecord, the others come from `extra`
+    record_attributes = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "line": record.lineno,
+            "function": record.funcName,
+            "pid": record.process,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.record_attributes:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# handlers added by the setup functions, so that calling them again, e.g. by
+# creating a second `Logger`, does not add a second handler
+_handlers: Dict[LoggerName, logging.Handler] = {}
+
+
 def setup_logger(config):
+    """
+    Log to stdout, as text or, with `config["format"] = "json"`, as JSON
+    """
     logger = logging.getLogger(LoggerName.stdout.value)
     logger.setLevel(config["whitelisted"]["loglevel"])
+    if LoggerName.stdout in _handlers:
+        return logger
 
     log_format = "[%(asctime)s][PID:%(process)d][%(module)s:%(lineno)d:%(funcName)s][%(levelname)s]\t%(message)s"
 
-    formatter = logging.Formatter(log_format)
+    if config.get("format") == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(log_format)
     stream_handler = StreamHandler(sys.stdout)
     stream_handler.setFormatter(formatter)
     logger.addHandler(stream_handler)
+    _handlers[LoggerName.stdout] = stream_handler
     return logger
 
 
+class BatchingSlackHandler(logging.Handler):
+    """
+    Posts log records to a Slack webhook from a background thread, so that
+    logging an error never waits for Slack.
+
+    Records are queued by `emit` and sent in batches: when `batch_size`
+    messages are waiting or the oldest has waited `flush_interval` seconds.
+    Records in a batch with the same level, location and message are sent
+    once, with a count and the times of the first and the last. At most
+    `max_posts` posts are made per `per_seconds`; messages that arrive while
+    the limit is reached are merged into the next post. When the queue is
+    full, records are dropped and the number of dropped records is reported
+    in the next post.
+
+    `flush` and `close` send whatever is waiting, which `logging.shutdown`
+    does at exit.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        url: str,
+        username: str = "logger",
+        icon_emoji: str = ":robot_face:",
+        batch_size: int = 20,
+        flush_interval: float = 2.0,
+        max_posts: int = 10,
+        per_seconds: float = 60.0,
+        queue_size: int = 1000,
+        max_chars: int = 3500,
+        timeout: float = 5.0,
+    ):
+        super().__init__()
+        self.url = url
+        self.username = username
+        self.icon_emoji = icon_emoji
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_posts = max_posts
+        self.per_seconds = per_seconds
+        self.max_chars = max_chars
+        self.timeout = timeout
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._posts = []  # times of recent posts, for the rate limit
+        self._thread = threading.Thread(
+            target=self._run, name="slack-logger", daemon=True
+        )
+        self._thread.start()
+
+    @staticmethod
+    def _key(record) -> tuple:
+        return (
+            record.levelno,
+            record.name,
+            record.pathname,
+            record.lineno,
+            record.getMessage(),
+        )
+
+    def emit(self, record):
+        try:
+            self._queue.put_nowait(
+                (self._key(record), self.format(record), record.created)
+            )
+        except queue.Full:
+            # Handler.handle holds self.lock around emit
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def flush(self, timeout: float = 10.0):
+        """
+        Send everything that was logged so far, ignoring the rate limit
+        """
+        if not self._thread.is_alive():
+            return
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def close(self):
+        if self._thread.is_alive():
+            self.flush()
+            self._queue.put(self._STOP)
+            self._thread.join(self.timeout)
+        super().close()
+
+    def _rate_limited(self) -> bool:
+        now = time.monotonic()
+        self._posts = [t for t in self._posts if now - t < self.per_seconds]
+        return len(self._posts) >= self.max_posts
+
+    def _run(self):
+        pending, since = [], None
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            if item is self._STOP:
+                return
+            if isinstance(item, threading.Event):
+                self._send(pending)
+                pending = []
+                item.set()
+                continue
+            if item is not None:
+                if not pending:
+                    since = time.monotonic()
+                pending.append(item)
+            due = pending and (
+                len(pending) >= self.batch_size
+                or time.monotonic() - since >= self.flush_interval
+            )
+            if due and not self._rate_limited():
+                self._send(pending)
+                pending = []
+
+    def _send(self, messages: List[tuple]):
+        """
+        `messages` are `(key, formatted, created)` tuples from `emit`
+        """
+        self.acquire()
+        try:
+            dropped, self.dropped = self.dropped, 0
+        finally:
+            self.release()
+        if not messages and not dropped:
+            return
+        groups = OrderedDict()
+        for key, message, created in messages:
+            if key in groups:
+                groups[key][1] += 1
+                groups[key][3] = created
+            else:
+                groups[key] = [message, 1, created, created]
+        lines = []
+        for message, count, first, last in groups.values():
+            if count > 1:
+                message += f" (x{count}, {_clock(first)} to {_clock(last)})"
+            lines.append(message)
+        if dropped:
+            lines.append(f"({dropped} messages dropped)")
+        text = "\n".join(lines)
+        if len(text) > self.max_chars:
+            text = text[: self.max_chars] + "\n... (truncated)"
+        payload = {
+            "username": self.username,
+            "icon_emoji": self.icon_emoji,
+            "text": text,
+        }
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        self._posts.append(time.monotonic())
+        try:
+            urllib.request.urlopen(request, timeout=self.timeout).close()
+        except Exception as e:
+            # never let a Slack outage take down the job
+            sys.stderr.write(f"Could not send log messages to Slack: {e}\n")
+
+
+def _clock(created: float) -> str:
+    return time.strftime("%H:%M:%S", time.localtime(created))
+
+
 def setup_slack_logger(config):
+    """
+    `config["slack"]` can hold keyword arguments for `BatchingSlackHandler`
+    """
     slack_logger = logging.getLogger(LoggerName.slack.value)
-    slack_handler = SlackHandler(
-        username="logger", icon_emoji=":robot_face:", url=config["slack_webhook"]
+    if LoggerName.slack in _handlers:
+        _handlers[LoggerName.slack].setLevel(config["whitelisted"]["loglevel"])
+        return slack_logger
+    slack_handler = BatchingSlackHandler(
+        url=config["slack_webhook"], **config.get("slack", {})
     )
     slack_handler.setLevel(config["whitelisted"]["loglevel"])
 
-    log_format = "[%(name)s][%(asctime)s][%(module)s:%(lineno)d:%(funcName)s][%(levelname)s]\t%(message)s"
-    slack_formattter = SlackFormatter(log_format)
+    # no time, Slack shows when a batch was posted and repeats get their own
+    log_format = "[%(name)s][%(module)s:%(lineno)d:%(funcName)s][%(levelname)s]\t%(message)s"
+    slack_formattter = logging.Formatter(log_format)
     slack_handler.setFormatter(slack_formattter)
     slack_logger.addHandler(slack_handler)
+    _handlers[LoggerName.slack] = slack_handler
     return slack_logger
 
 
+def apply_loglevels(config):
+    """
+    Set the whitelisted level on the top level logger of every whitelisted
+    name, and the blacklisted level on the root logger.
+
+    Loggers without a level of their own use the level of their closest
+    ancestor, so every logger, including the ones created later, gets the
+    level of its rule without visiting `logging.Logger.manager.loggerDict`.
+    """
+    logging.getLogger().setLevel(config["blacklisted"]["loglevel"])
+    for name in config["whitelisted"]["whitelist"]:
+        logging.getLogger(name).setLevel(config["whitelisted"]["loglevel"])
+
+
+LOGLEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "critical": logging.CRITICAL,
+}
+
+
 class Logger:
     def __init__(self, config: dict, default_loggers: List[LoggerName]):
         assert "whitelisted" in config
@@ -66,40 +317,50 @@ class Logger:
         self.config = config
         self.loggers = self.setup_loggers()
         self.default_loggers = default_loggers
-        for loglevel in ["debug", "info", "warning", "error", "critical"]:
-            f = partial(self.log_all, loglevel)
-            setattr(self, loglevel, f)
+        for loglevel, levelno in LOGLEVELS.items():
+            setattr(self, loglevel, self._dispatcher(levelno))
 
     def setup_loggers(self) -> Dict[LoggerName, logging.Logger]:
-        # setup logger for stdout
         logger = setup_logger(self.config)
-        self.set_loglevel(logger)
-
-        # setup logger for slack
         logger_slack = setup_slack_logger(self.config)
-        # set verbose=False because we don't want to send info about loglevel
-        # tweaking to slack
-        self.set_loglevel(logger_slack, verbose=False)
+        apply_loglevels(self.config)
+        logger.debug(
+            f"Loglevel {self.config['whitelisted']['loglevel']} for "
+            f"{', '.join(self.config['whitelisted']['whitelist'])}, "
+            f"{self.config['blacklisted']['loglevel']} for all other loggers"
+        )
         return {LoggerName.stdout: logger, LoggerName.slack: logger_slack}
 
-    def set_loglevel(self, logger, verbose=True):
-        for l in logging.Logger.manager.loggerDict.keys():
-            if l.split(".")[0] in self.config["whitelisted"]["whitelist"]:
-                logging.getLogger(l).setLevel(self.config["whitelisted"]["loglevel"])
-                if not verbose:
-                    continue
-                logger.info(
-                    f"Setting loglevel for {l} to {self.config['whitelisted']['loglevel']}"
-                )
-            else:
-                logging.getLogger(l).setLevel(self.config["blacklisted"]["loglevel"])
-                if not verbose:
-                    continue
-                logger.info(
-                    f"Setting loglevel for {l} to {self.config['blacklisted']['loglevel']}"
+    def _dispatcher(self, levelno: int):
+        """
+        Create the method for one level, e.g. `Logger.debug`.
+
+        The message goes to the default loggers, plus the loggers of the
+        `LoggerName`s that end the arguments. The other arguments are merged
+        into the message with `%`, and only by loggers that are enabled for
+        the level, so that e.g. `logger.debug("row %s", row)` in a loop costs
+        little more than a level check when debug logging is off. Keyword
+        arguments such as `exc_info` and `extra` are passed on as they are.
+        """
+        targets = tuple(self.loggers[name] for name in self.default_loggers)
+
+        def log(msg, *args, **kwargs):
+            loggers = targets
+            if args and args[-1].__class__ is LoggerName:
+                n = len(args) - 1
+                while n and args[n - 1].__class__ is LoggerName:
+                    n -= 1
+                loggers += tuple(
+                    self.loggers[name]
+                    for name in args[n:]
+                    if name not in self.default_loggers
                 )
+                args = args[:n]
+            for logger in loggers:
+                if logger.isEnabledFor(levelno):
+                    logger._log(levelno, msg, args, **kwargs)
+
+        return log
 
     def log_all(self, loglevel, msg: str, *include: List[LoggerName]):
-        for logger_name in self.default_loggers + list(include):
-            logger = self.loggers.get(logger_name)
-            getattr(logger, loglevel)(msg)
+        getattr(self, loglevel)(msg, *include)
@@ -0,0 +1,200 @@
+"""
+Metrics in the CloudWatch Embedded Metric Format (EMF).
+
+The container logs go to CloudWatch Logs through the awslogs driver. A log
+line in EMF is turned into metrics by CloudWatch itself, so a job can publish
+metrics by printing, without calls to the CloudWatch API.
+
+    metrics = MetricsLogger(namespace="zendishes", dimensions={"task": "foryou"})
+    metrics.put("rows", len(rows), unit="Count")
+    with metrics.timer("query_time"):
+        run_query()
+
+Values are buffered and written in batches: every metric of a set of
+dimensions goes into one line, with all its values since the last flush.
+The buffer is flushed when `max_values` values are waiting, by a timer
+`flush_interval` seconds after the first value that is waiting, by `close`
+and at exit.
+"""
+import atexit
+import json
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List
+
+# limits of a single EMF document
+MAX_METRICS = 100
+MAX_VALUES = 100
+
+UNITS = {
+    "Seconds",
+    "Microseconds",
+    "Milliseconds",
+    "Bytes",
+    "Kilobytes",
+    "Megabytes",
+    "Gigabytes",
+    "Terabytes",
+    "Bits",
+    "Kilobits",
+    "Megabits",
+    "Gigabits",
+    "Terabits",
+    "Percent",
+    "Count",
+    "Bytes/Second",
+    "Kilobytes/Second",
+    "Megabytes/Second",
+    "Gigabytes/Second",
+    "Terabytes/Second",
+    "Bits/Second",
+    "Kilobits/Second",
+    "Megabits/Second",
+    "Gigabits/Second",
+    "Terabits/Second",
+    "Count/Second",
+    "None",
+}
+
+
+# loggers to flush at exit, held weakly so that they can still be collected
+_loggers = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all():
+    for logger in list(_loggers):
+        logger.flush()
+
+
+class MetricsLogger:
+    def __init__(
+        self,
+        namespace: str,
+        dimensions: Dict[str, str] = None,
+        stream=None,
+        max_values: int = 1000,
+        flush_interval: float = 10.0,
+    ):
+        self.namespace = namespace
+        self.dimensions = dict(dimensions or {})
+        self.stream = stream
+        self.max_values = max_values
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # dimensions -> metric name -> (unit, values)
+        self._buffer = OrderedDict()
+        self._buffered = 0
+        self._timer = None
+        _loggers.add(self)
+
+    def put(self, name: str, value: float, unit: str = "None", **dimensions):
+        """
+        Record a value of metric `name`. `dimensions` are added to the
+        dimensions of the logger for this value only.
+        """
+        if unit not in UNITS:
+            raise ValueError(f"Unknown unit {unit!r} for metric {name}")
+        key = tuple(sorted(dict(self.dimensions, **dimensions).items()))
+        with self._lock:
+            metrics = self._buffer.setdefault(key, OrderedDict())
+            metric_unit, values = metrics.setdefault(name, (unit, []))
+            if metric_unit != unit:
+                raise ValueError(f"Metric {name} is in {metric_unit}, not {unit}")
+            values.append(value)
+            self._buffered += 1
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            due = self._buffered >= self.max_values
+        if due:
+            self.flush()
+
+    @contextmanager
+    def timer(self, name: str, **dimensions):
+        """
+        Record the time spent in the block, in milliseconds
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.put(
+                name,
+                (time.perf_counter() - start) * 1000,
+                unit="Milliseconds",
+                **dimensions,
+            )
+
+    def _document(self, dimensions: dict, entries: list, timestamp: int) -> dict:
+        document = {
+            "_aws": {
+                "Timestamp": timestamp,
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [sorted(dimensions)],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit} for name, unit, _ in entries
+                        ],
+                    }
+                ],
+            }
+        }
+        document.update(dimensions)
+        for name, _, values in entries:
+            document[name] = values[0] if len(values) == 1 else values
+        return document
+
+    def documents(self, buffer) -> List[dict]:
+        """
+        EMF documents for the buffered values, split to stay within the
+        limits on metrics and values per document
+        """
+        timestamp = int(time.time() * 1000)
+        documents = []
+        for key, metrics in buffer.items():
+            rounds = max(len(values) for _, values in metrics.values())
+            for start in range(0, rounds, MAX_VALUES):
+                entries = [
+                    (name, unit, values[start : start + MAX_VALUES])
+                    for name, (unit, values) in metrics.items()
+                    if len(values) > start
+                ]
+                for i in range(0, len(entries), MAX_METRICS):
+                    documents.append(
+                        self._document(
+                            dict(key), entries[i : i + MAX_METRICS], timestamp
+                        )
+                    )
+        return documents
+
+    def flush(self):
+        with self._lock:
+            buffer, self._buffer = self._buffer, OrderedDict()
+            self._buffered = 0
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        if not buffer:
+            return
+        stream = self.stream or sys.stdout
+        stream.write(
+            "".join(
+                json.dumps(document, separators=(",", ":")) + "\n"
+                for document in self.documents(buffer)
+            )
+        )
+        stream.flush()
+
+    def close(self):
+        """
+        Flush, and no longer flush at exit
+        """
+        self.flush()
+        _loggers.discard(self)
@@ -0,0 +1,71 @@
+"""
+Splitting the work of a sharded scheduled task between its shards.
+
+Every shard of a task with `shard_count` above one runs the same script, with
+`SHARD_INDEX` and `SHARD_COUNT` set in its environment. Without them, the
+script is the only shard.
+
+    for user_id in partition(user_ids):
+        ...
+
+Items are assigned by a hash of their key rather than by position, so an
+item stays on the same shard when other items are added or removed, and
+every shard computes the same assignment without coordination.
+"""
+import hashlib
+import os
+from typing import Callable, Iterable, Iterator, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def current_shard() -> Tuple[int, int]:
+    """
+    `(index, count)` of the shard this process runs as
+    """
+    index = int(os.environ.get("SHARD_INDEX", 0))
+    count = int(os.environ.get("SHARD_COUNT", 1))
+    if not 0 <= index < count:
+        raise ValueError(f"SHARD_INDEX {index} is not in 0 to {count - 1}")
+    return index, count
+
+
+def shard_of(key, count: int) -> int:
+    """
+    The shard of `key`. Python's `hash` differs between processes, so the
+    key is hashed with md5 instead.
+    """
+    digest = hashlib.md5(str(key).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+def partition(
+    items: Iterable[T],
+    key: Callable[[T], object] = None,
+    index: int = None,
+    count: int = None,
+) -> Iterator[T]:
+    """
+    The items that belong to shard `index` of `count`, by default the
+    current shard. `key` gives the value that is hashed, by default the item.
+    """
+    if index is None or count is None:
+        index, count = current_shard()
+    if count == 1:
+        yield from items
+        return
+    for item in items:
+        if shard_of(item if key is None else key(item), count) == index:
+            yield item
+
+
+def shard_range(n: int, index: int = None, count: int = None) -> range:
+    """
+    A contiguous part of `range(n)`, e.g. of the rows of a table, with the
+    sizes of all parts differing by at most one
+    """
+    if index is None or count is None:
+        index, count = current_shard()
+    size, rest = divmod(n, count)
+    start = index * size + min(index, rest)
+    return range(start, start + size + (index < rest))
@@ -0,0 +1,155 @@
+"""
+Hooks around the stages of generating a file:
+
+- `document`: building the document, e.g. rendering a Jinja template
+- `dump`: serializing the document, e.g. `yaml.dump`
+- `write`: writing the dumped content to disk
+
+A hook is called with a `FileEvent` after each stage. Without hooks the stages
+are not timed at all.
+
+    with collect() as stats:
+        project.make_files()
+    stats.write_json("generation-profile.json")
+
+Files rendered in a process pool run their stages in the workers, so only
+their `write` stage is seen by hooks in the main process.
+"""
+import csv
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, List
+
+STAGES = ("document", "dump", "write")
+
+hooks: List[Callable] = []
+
+
+@dataclass
+class FileEvent:
+    stage: str
+    filepath: str
+    filetype: str
+    file_class: str
+    seconds: float
+    size: int
+
+
+def add_hook(hook: Callable):
+    hooks.append(hook)
+
+
+def remove_hook(hook: Callable):
+    hooks.remove(hook)
+
+
+@contextmanager
+def stage(file, name: str):
+    """
+    Time a stage of `file`. The `size` of the output can be set on the
+    yielded dict.
+    """
+    if not hooks:
+        yield {}
+        return
+    result = {"size": 0}
+    start = time.perf_counter()
+    yield result
+    event = FileEvent(
+        stage=name,
+        filepath=file.filepath,
+        filetype=file.filetype.name,
+        file_class=type(file).__name__,
+        seconds=time.perf_counter() - start,
+        size=result["size"],
+    )
+    for hook in list(hooks):
+        hook(event)
+
+
+class FileStats:
+    """
+    Hook that collects the events of all files
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.files = defaultdict(
+            lambda: {
+                "filetype": None,
+                "file_class": None,
+                "size": 0,
+                **dict.fromkeys(STAGES, 0.0),
+            }
+        )
+
+    def __call__(self, event: FileEvent):
+        with self._lock:
+            entry = self.files[event.filepath]
+            entry["filetype"] = event.filetype
+            entry["file_class"] = event.file_class
+            entry[event.stage] += event.seconds
+            if event.size:
+                entry["size"] = event.size
+
+    def rows(self) -> List[dict]:
+        """
+        One row per file, slowest first
+        """
+        rows = [
+            dict(filepath=path, total=sum(entry[s] for s in STAGES), **entry)
+            for path, entry in self.files.items()
+        ]
+        return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+    def totals(self) -> dict:
+        """
+        Number of files, bytes and seconds per stage for every `FileType`
+        """
+        totals = defaultdict(
+            lambda: {"files": 0, "size": 0, **dict.fromkeys(STAGES, 0.0)}
+        )
+        for entry in self.files.values():
+            total = totals[entry["filetype"]]
+            total["files"] += 1
+            total["size"] += entry["size"]
+            for s in STAGES:
+                total[s] += entry[s]
+        return dict(totals)
+
+    def report(self, slowest: int = 10) -> dict:
+        return {"slowest": self.rows()[:slowest], "totals": self.totals()}
+
+    def write_json(self, path: str, slowest: int = 10):
+        with open(path, "w") as f:
+            json.dump(self.report(slowest), f, indent=2)
+
+    def write_csv(self, path: str):
+        fields = ["filepath", "filetype", "file_class", "size", *STAGES, "total"]
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.rows())
+
+    def write(self, path: str):
+        """
+        Write the report as CSV or JSON, depending on the extension of `path`
+        """
+        if path.endswith(".csv"):
+            self.write_csv(path)
+        else:
+            self.write_json(path)
+
+
+@contextmanager
+def collect():
+    stats = FileStats()
+    add_hook(stats)
+    try:
+        yield stats
+    finally:
+        remove_hook(stats)
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+
+def content_hash(content) -> str:
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def file_hash(filepath: str) -> str:
+    with open(filepath, "rb") as f:
+        return content_hash(f.read())
+
+
+@dataclass
+class GenerationReport:
+    """
+    Lists the paths touched by an incremental run, grouped by what happened to them
+    """
+
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        lines = [
+            f"{len(self.added)} added, {len(self.changed)} changed, "
+            f"{len(self.unchanged)} unchanged, {len(self.removed)} removed"
+        ]
+        for label, paths in [
+            ("added", self.added),
+            ("changed", self.changed),
+            ("removed", self.removed),
+        ]:
+            lines.extend(f"  {label}: {path}" for path in sorted(paths))
+        return "\n".join(lines)
+
+
+class Manifest:
+    """
+    Keeps the sha256 of every file written by the generator, so that an
+    incremental run only rewrites files whose content actually changed.
+
+    Each entry also stores the size and mtime the file had right after it was
+    written. When those still match, the file is known to be untouched and
+    does not have to be read and hashed again.
+
+    With `dry_run`, nothing is written, but the report still lists what would change.
+    """
+
+    def __init__(self, filepath: str, dry_run: bool = False):
+        self.filepath = filepath
+        self.dry_run = dry_run
+        self.previous = self._load()
+        self.entries = {}
+        self.report = GenerationReport()
+
+    def _load(self) -> Dict[str, dict]:
+        if not os.path.exists(self.filepath):
+            return {}
+        with open(self.filepath) as f:
+            return json.load(f)["files"]
+
+    def is_unchanged(self, path: str, digest: str) -> bool:
+        """
+        True if the file at `path` exists and its content hashes to `digest`
+        """
+        if not os.path.exists(path):
+            return False
+        entry = self.previous.get(path)
+        stat = os.stat(path)
+        if (
+            entry is not None
+            and entry["sha256"] == digest
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+        ):
+            return True
+        return file_hash(path) == digest
+
+    def is_modified_locally(self, path: str) -> bool:
+        """
+        True if the file at `path` was changed since the generator last wrote it,
+        or was never written by the generator at all
+        """
+        entry = self.previous.get(path)
+        return entry is None or not self.is_unchanged(path, entry["sha256"])
+
+    def record(self, path: str, digest: str):
+        if self.dry_run:
+            self.entries[path] = {"sha256": digest}
+            return
+        stat = os.stat(path)
+        self.entries[path] = {
+            "sha256": digest,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+
+    def keep(self, path: str):
+        """
+        Leave a file as it is on disk, but keep tracking it
+        """
+        self.report.unchanged.append(path)
+        if path in self.previous:
+            self.entries[path] = self.previous[path]
+
+    def write_file(self, file, dumped: str):
+        """
+        Write a rendered `FileBase` unless the file on disk already has the same content
+        """
+        path = file.filepath
+        digest = content_hash(dumped)
+        exists = os.path.exists(path)
+        if exists and not file.overwrite_ok:
+            self.keep(path)
+        elif self.is_unchanged(path, digest):
+            self.report.unchanged.append(path)
+            self.record(path, digest)
+        else:
+            if not self.dry_run:
+                file.write(dumped)
+            (self.report.changed if exists else self.report.added).append(path)
+            self.record(path, digest)
+
+    def copy_file(self, src: str, dst: str):
+        """
+        Copy a static asset, but only when the source changed.
+        A destination that was edited by hand is left alone.
+        """
+        digest = file_hash(src)
+        exists = os.path.exists(dst)
+        if self.is_unchanged(dst, digest):
+            self.report.unchanged.append(dst)
+            self.record(dst, digest)
+        elif exists and self.is_modified_locally(dst):
+            print(f"File modified locally, not overwriting. {dst}")
+            self.keep(dst)
+        else:
+            if not self.dry_run:
+                print(f"Copying file {dst}")
+                folder = os.path.dirname(dst)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                shutil.copyfile(src, dst)
+            (self.report.changed if exists else self.report.added).append(dst)
+            self.record(dst, digest)
+
+    def copy_tree(self, src: str, dst: str):
+        for dirpath, dirnames, filenames in os.walk(src):
+            dirnames[:] = sorted(d for d in dirnames if d != "__pycache__")
+            relpath = os.path.relpath(dirpath, src)
+            for filename in sorted(filenames):
+                self.copy_file(
+                    os.path.join(dirpath, filename),
+                    os.path.normpath(os.path.join(dst, relpath, filename)),
+                )
+
+    def save(self, prune: bool = True):
+        """
+        Write the manifest to disk.
+
+        With `prune`, files that were tracked before but not produced by this
+        run are reported as removed and dropped from the manifest. Without it,
+        they are carried over, which is what a partial run wants.
+        """
+        for path, entry in self.previous.items():
+            if path in self.entries:
+                continue
+            if prune:
+                self.report.removed.append(path)
+            else:
+                self.entries[path] = entry
+        if self.dry_run:
+            return
+        with open(self.filepath, "w") as f:
+            json.dump({"files": self.entries}, f, indent=2, sort_keys=True)
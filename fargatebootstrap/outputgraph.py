@@ -0,0 +1,111 @@
+from typing import Dict, Iterable, List, Tuple
+
+from .engine import render_files
+from .projectfiles import FileBase
+
+
+class OutputConflictError(ValueError):
+    """
+    Raised when two files with different content claim the same path
+    """
+
+
+class OutputGraph:
+    """
+    The files to generate for a project, keyed by `filepath`.
+
+    Adding a file for a path that is already taken is a no-op as long as both
+    files produce the same content, e.g. when a `DockerImage` is shared by
+    several tasks. Different content for the same path raises
+    `OutputConflictError`. Edges come from `FileBase.depends_on`.
+    """
+
+    def __init__(self, files: Iterable[FileBase] = ()):
+        self.files: Dict[str, FileBase] = {}
+        self._rendered: Dict[str, str] = {}
+        for file in files:
+            self.add(file)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, filepath: str):
+        return filepath in self.files
+
+    def add(self, file: FileBase) -> FileBase:
+        """
+        Add `file` and return the file that owns its path
+        """
+        existing = self.files.get(file.filepath)
+        if existing is None:
+            self.files[file.filepath] = file
+            return file
+        if existing == file:
+            return existing
+        if self.dumped(existing) != file.dump():
+            raise OutputConflictError(
+                f"{type(existing).__name__} and {type(file).__name__} "
+                f"produce different content for {file.filepath}"
+            )
+        return existing
+
+    def dumped(self, file: FileBase) -> str:
+        """
+        The dumped content of `file`, rendered at most once
+        """
+        if file.filepath not in self._rendered:
+            self._rendered[file.filepath] = file.dump()
+        return self._rendered[file.filepath]
+
+    def dependencies(self, filepath: str) -> Tuple[str, ...]:
+        """
+        Generated files that the file at `filepath` refers to
+        """
+        return tuple(
+            path for path in self.files[filepath].depends_on if path in self.files
+        )
+
+    def dependents(self, filepath: str) -> Tuple[str, ...]:
+        """
+        Generated files that refer to the file at `filepath`
+        """
+        return tuple(
+            path for path in self.files if filepath in self.dependencies(path)
+        )
+
+    def order(self) -> List[FileBase]:
+        """
+        All files, each one after the files it depends on
+        """
+        ordered, done, visiting = [], set(), set()
+
+        def visit(path):
+            if path in done:
+                return
+            if path in visiting:
+                raise ValueError(f"Dependency cycle through {path}")
+            visiting.add(path)
+            for dependency in self.dependencies(path):
+                visit(dependency)
+            visiting.remove(path)
+            done.add(path)
+            ordered.append(self.files[path])
+
+        for path in self.files:
+            visit(path)
+        return ordered
+
+    def render(
+        self, workers: int = 1, executor: str = "thread"
+    ) -> Tuple[List[FileBase], List[str]]:
+        """
+        Render every file that was not rendered yet.
+        Returns the files in dependency order together with their content.
+        """
+        files = self.order()
+        todo = [file for file in files if file.filepath not in self._rendered]
+        for file, dumped in zip(
+            todo, render_files(todo, workers=workers, executor=executor)
+        ):
+            self._rendered[file.filepath] = dumped
+        return files, [self._rendered[file.filepath] for file in files]
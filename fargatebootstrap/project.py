@@ -1,20 +1,42 @@
 import subprocess
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Tuple
+from typing import List, Tuple
 import os
 import shutil
-from .projectdata import ProjectConfig, EcsTask, TaskType
+from . import templates
+from .build import (
+    BUILD_COMMAND,
+    FAILED,
+    LOCK_COMMAND,
+    BuildOrchestrator,
+    image_build_jobs,
+    lock_jobs,
+)
+from .engine import write_files
+from .manifest import GenerationReport, Manifest
+from .outputgraph import OutputGraph
+from .projectdata import BaseImage, ProjectConfig, EcsTask, TaskType, unique_images
 from .projectfiles import (
+    FileBase,
+    BaseDockerFile,
     DockerFile,
+    DockerIgnoreFile,
     Pipfile,
     PythonScriptFile,
     MakeFile,
     DockerComposeFile,
     BuildspecDockerbuildFile,
     ContainerDefinitionsFile,
+    TerraformBaseImageFile,
     TerraformScheduledTaskFile,
+    TerraformScheduledTasksFile,
+    TerraformServiceFile,
+    TerraformTaskMapFile,
 )
 
+TERRAFORM_STATES = (None, "environment", "group")
+
 
 @dataclass
 class Project:
@@ -25,47 +47,228 @@ class Project:
     - one Dockerfile per Docker image
     - one buildspec file per Task
     - one compose file per task
-    - one terraform file, each with cicd module and scheduled_task module, per task
+    - one terraform file, each with cicd module and scheduled_task module or
+      service, per task
+
+    With `incremental`, a manifest of content hashes is kept in `manifest_path`
+    and files whose content did not change are not rewritten.
+
+    `workers` sets how many files are rendered and written concurrently, using
+    a `thread` or `process` pool as chosen by `executor`. The output is the
+    same as with a single worker.
+
+    With `shared_base_image`, the common runtime is built once into a project
+    level base image and every standard `DockerFile` is built `FROM` it.
+
+    With `cached_builds`, the CodeBuild buildspecs reuse the layers of the
+    previous images and only build and push images whose sources changed.
+
+    Templates in `template_dirs` replace the bundled templates with the same
+    file name, see `templates.TEMPLATE_FILES`.
+
+    With `consolidated_terraform`, the scheduled tasks are a single `for_each`
+    module over a generated map, instead of modules per task. With
+    `terraform_states`, they are split into one Terraform state per
+    `environment` or task `group`, each in a subfolder of `terraform/`.
+    Services and the base image repository stay in the root state.
     """
 
     config: ProjectConfig
     tasks: Tuple[EcsTask]
+    incremental: bool = False
+    workers: int = 1
+    executor: str = "thread"
+    shared_base_image: bool = False
+    cached_builds: bool = False
+    template_dirs: Tuple[str, ...] = ()
+    consolidated_terraform: bool = False
+    terraform_states: str = None
     # TODO turn below three vars into args and make @property def register on File classes
     buildspec_dir = "buildspec"
     containers_dir = "containers"
     terraform_dir = "terraform"
+    manifest_path = ".fargatebootstrap-manifest.json"
+
+    def __post_init__(self):
+        if self.terraform_states not in TERRAFORM_STATES:
+            raise ValueError(
+                f"terraform_states must be environment or group, "
+                f"got {self.terraform_states!r}"
+            )
+        if self.terraform_states and not self.consolidated_terraform:
+            raise ValueError("terraform_states needs consolidated_terraform")
+
+    def terraform_folder(self, task: EcsTask) -> str:
+        """
+        The folder of the Terraform state of a scheduled task
+        """
+        if self.terraform_states == "environment":
+            return os.path.join(self.terraform_dir, task.environment)
+        if self.terraform_states == "group":
+            return os.path.join(self.terraform_dir, task.group or "default")
+        return self.terraform_dir
+
+    @property
+    def terraform_folders(self) -> Tuple[str, ...]:
+        """
+        The root folder, then the folders of the other states
+        """
+        folders = {
+            self.terraform_folder(task)
+            for task in self.tasks
+            if task.task_type == TaskType.scheduled
+        }
+        folders.discard(self.terraform_dir)
+        return (self.terraform_dir,) + tuple(sorted(folders))
+
+    @property
+    def base_image(self) -> BaseImage:
+        """
+        The shared base image, if `shared_base_image` is set and at least one
+        image is built on top of it
+        """
+        if not self.shared_base_image:
+            return None
+        versions = {
+            image.python_version
+            for same_name in unique_images(self.tasks).values()
+            for image in same_name
+            if image.uses_base_image
+        }
+        if not versions:
+            return None
+        if len(versions) > 1:
+            raise ValueError(
+                f"Images on a shared base must use one python version, got {sorted(versions)}"
+            )
+        return BaseImage(
+            repository=f"{self.config.git_repo_name}_base",
+            ecr_endpoint=self.config.ecr_endpoint,
+            python_version=versions.pop(),
+        )
 
-    def make_files(self):
+    def collect_files(self) -> List[FileBase]:
+        base_image = self.base_image
         files = []
-        files.append(MakeFile(self.tasks))
+        files.append(
+            MakeFile(
+                self.tasks,
+                base_image=base_image,
+                terraform_folders=self.terraform_folders,
+            )
+        )
+        if base_image is not None:
+            files.append(BaseDockerFile(base_image))
+            files.append(DockerIgnoreFile(base_image))
+            files.append(Pipfile(base_image))
+            files.append(TerraformBaseImageFile(base_image))
+        # container definitions of the scheduled tasks per Terraform state
+        states = {}
         for task in self.tasks:
-            files.append(DockerComposeFile(task=task))
-            files.append(BuildspecDockerbuildFile(task=task))
-            cdf = ContainerDefinitionsFile(task=task)
-            files.append(cdf)
+            task_base_image = (
+                base_image
+                if any(d.image.uses_base_image for d in task.container_deployments)
+                else None
+            )
+            files.append(DockerComposeFile(task=task, cache=self.cached_builds))
+            files.append(
+                BuildspecDockerbuildFile(
+                    task=task,
+                    base_image=task_base_image,
+                    cache=self.cached_builds,
+                    ecs_cluster_name=self.config.ecs_cluster_name,
+                )
+            )
+            shard_files = ()
+            if task.task_type == TaskType.scheduled and task.shard_count > 1:
+                shard_files = tuple(
+                    ContainerDefinitionsFile(task=task, shard_index=i)
+                    for i in task.shards
+                )
+                files.extend(shard_files)
+                cdf = shard_files[0]
+            else:
+                cdf = ContainerDefinitionsFile(task=task)
+                files.append(cdf)
 
             # Generate Dockerfiles and initiate script files
             for deployment in task.container_deployments:
-                files.append(DockerFile(deployment.image))
+                dockerfile = DockerFile(deployment.image, base_image=base_image)
+                files.append(dockerfile)
+                files.append(
+                    DockerIgnoreFile(
+                        deployment.image, modules=dockerfile.copies_modules
+                    )
+                )
                 files.append(Pipfile(deployment.image))
                 files.append(PythonScriptFile(deployment.image))
 
-            if task.task_type == TaskType.scheduled:
+            if task.task_type == TaskType.scheduled and self.consolidated_terraform:
+                states.setdefault(self.terraform_folder(task), []).extend(
+                    shard_files or (cdf,)
+                )
+            elif task.task_type == TaskType.scheduled:
                 files.append(
                     TerraformScheduledTaskFile(
                         task=task,
                         schedule_expression=task.schedule_expression,
                         project_config=self.config,
                         container_definitions_file=cdf,
+                        shard_files=shard_files,
+                    )
+                )
+            elif task.task_type == TaskType.service:
+                files.append(
+                    TerraformServiceFile(
+                        task=task,
+                        project_config=self.config,
+                        container_definitions_file=cdf,
                     )
                 )
             else:
-                raise NotImplementedError("only scheduled tasks implemented for now")
+                raise NotImplementedError(f"unknown task type {task.task_type}")
+        for folder, container_definitions_files in states.items():
+            files.append(TerraformScheduledTasksFile(self.config, folder=folder))
+            files.append(
+                TerraformTaskMapFile(container_definitions_files, folder=folder)
+            )
+        return files
+
+    def output_graph(self) -> OutputGraph:
+        return OutputGraph(self.collect_files())
+
+    def make_files(self, manifest: Manifest = None):
+        templates.loader.set_override_dirs(self.template_dirs)
+        files, rendered = self.output_graph().render(
+            workers=self.workers, executor=self.executor
+        )
+        if not self.incremental and manifest is None:
+            write_files(files, rendered, workers=self.workers)
+            return
 
-        for file in files:
-            file.write(file.dump())
+        with self._manifest(manifest) as manifest:
+            if manifest.dry_run:
+                for file, dumped in zip(files, rendered):
+                    manifest.write_file(file, dumped)
+                return
+            write_files(
+                files, rendered, workers=self.workers, write=manifest.write_file
+            )
+
+    @contextmanager
+    def _manifest(self, manifest: Manifest = None):
+        """
+        Use the manifest of the surrounding run, or open one for a standalone call
+        """
+        if manifest is not None:
+            yield manifest
+            return
+        manifest = Manifest(self.manifest_path)
+        yield manifest
+        manifest.save(prune=False)
+        print(manifest.report.summary())
 
-    def copy_files(self):
+    def copy_files(self, manifest: Manifest = None):
         """
         Copy files from `files/` to correct destinations
         """
@@ -75,6 +278,23 @@ class Project:
             root_dir, "files/buildspec/buildspec-unittest-allenvs.yml"
         )
         terraform_src = os.path.join(root_dir, "files/terraform")
+        if self.incremental or manifest is not None:
+            with self._manifest(manifest) as manifest:
+                manifest.copy_tree(
+                    modules_src, os.path.join(self.containers_dir, "modules")
+                )
+                for folder in self.terraform_folders:
+                    manifest.copy_tree(terraform_src, folder)
+                for task in self.tasks:
+                    manifest.copy_file(
+                        buildspec_src,
+                        os.path.join(
+                            self.buildspec_dir,
+                            f"buildspec-unittest-{task.name}-allenvs.yml",
+                        ),
+                    )
+            return
+
         try:
             shutil.copytree(
                 src=modules_src, dst=os.path.join(self.containers_dir, "modules/")
@@ -82,10 +302,11 @@ class Project:
         except FileExistsError:
             print("modules files already copied")
 
-        try:
-            shutil.copytree(src=terraform_src, dst=self.terraform_dir)
-        except FileExistsError:
-            print("terraform files already copied")
+        for folder in self.terraform_folders:
+            try:
+                shutil.copytree(src=terraform_src, dst=folder)
+            except FileExistsError:
+                print("terraform files already copied")
 
         for task in self.tasks:
             try:
@@ -108,18 +329,66 @@ class Project:
         #         check=True,
         #     )
 
-    def build(self):
-        subprocess.run("make lock_dependencies", shell=True, check=True)
-        subprocess.run("make build_docker", shell=True, check=True)
+    def build(
+        self,
+        max_workers: int = 4,
+        build_command: str = BUILD_COMMAND,
+        lock_command: str = LOCK_COMMAND,
+    ):
+        """
+        Lock dependencies, then build every image, `max_workers` at a time.
+        Each Pipfile is locked once, and an image is built as soon as its own
+        lock is done. Locks whose Pipfile did not change, and images whose
+        Dockerfile and sources did not change since their last successful
+        build, are skipped. See `image_build_jobs` for `build_command` and
+        `lock_jobs` for `lock_command`.
+        """
+        images = unique_images(self.tasks)
+        jobs = lock_jobs(
+            images,
+            containers_dir=self.containers_dir,
+            lock_command=lock_command,
+            base_image=self.base_image,
+        )
+        jobs += image_build_jobs(
+            images,
+            containers_dir=self.containers_dir,
+            build_command=build_command,
+            base_image=self.base_image,
+            locked=True,
+        )
+        results = BuildOrchestrator(jobs, max_workers=max_workers).run()
+        for result in results:
+            if result.status == FAILED and result.returncode:
+                raise subprocess.CalledProcessError(result.returncode, result.command)
 
     def provision(self):
-        # TODO: Fix this
-        subprocess.run("cd terraform && terraform init")
-        # subprocess.run("make tfapply")
+        for folder in self.terraform_folders:
+            for command in ["terraform init", "terraform apply"]:
+                subprocess.run(f"cd {folder} && {command}", shell=True, check=True)
+
+    def plan(self) -> GenerationReport:
+        """
+        Report which files `bootstrap` would add, change or remove,
+        without writing anything
+        """
+        templates.loader.set_override_dirs(self.template_dirs)
+        manifest = Manifest(self.manifest_path, dry_run=True)
+        self.copy_files(manifest)
+        self.make_files(manifest)
+        manifest.save()
+        return manifest.report
 
     def bootstrap(self):
-        self.copy_files()
-        self.make_files()
+        if self.incremental:
+            manifest = Manifest(self.manifest_path)
+            self.copy_files(manifest)
+            self.make_files(manifest)
+            manifest.save()
+            print(manifest.report.summary())
+        else:
+            self.copy_files()
+            self.make_files()
         print(
             """
 *******************************************************************************
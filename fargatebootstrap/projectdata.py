@@ -1,6 +1,6 @@
 from enum import IntEnum
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 import abc
 
 
@@ -12,6 +12,7 @@ class FileType(IntEnum):
     python = 5
     makefile = 6
     terraform = 7
+    dockerignore = 8
 
 
 class TaskType(IntEnum):
@@ -19,7 +20,38 @@ class TaskType(IntEnum):
     service = 2
 
 
-@dataclass
+class ScalingMetric(IntEnum):
+    """
+    What target-tracking autoscaling of a service keeps at its target
+    """
+
+    # average utilization of the service, in percent
+    cpu = 1
+    memory = 2
+    # requests per task, from the load balancer target group
+    requests = 3
+
+
+class DockerfileMode(IntEnum):
+    standard = 1
+    # multi-stage build on a slim base, see `files/templates/Dockerfile-optimized.j2`
+    optimized = 2
+
+
+class ScriptSkeleton(IntEnum):
+    """
+    The skeleton of the script that is generated for a new image
+    """
+
+    # a plain `main()`
+    synchronous = 1
+    # asyncio workers with bounded concurrency, for I/O-bound jobs
+    asyncio = 2
+    # a process per vCPU of the task, for CPU-bound jobs
+    process_pool = 3
+
+
+@dataclass(frozen=True)
 class ProjectConfig:
     """
 
@@ -41,7 +73,7 @@ class ProjectConfig:
         return f"arn:aws:ecs:{self.region}:{self.account_id}:cluster/{self.ecs_cluster_name}"
 
 
-@dataclass
+@dataclass(frozen=True)
 class DockerImage:
     """
     Data for a single Docker image
@@ -54,17 +86,52 @@ class DockerImage:
     ecr_endpoint: str
     python_version: str = "3.7.4"
     tag: str = "latest"
+    dockerfile_mode: DockerfileMode = DockerfileMode.standard
+    script_skeleton: ScriptSkeleton = ScriptSkeleton.synchronous
+
+    @property
+    def repository(self):
+        return f"{self.name}_{self.environment}"
 
     @property
     def uri(self):
-        return f"{self.ecr_endpoint}/{self.name}_{self.environment}:{self.tag}"
+        return f"{self.ecr_endpoint}/{self.repository}:{self.tag}"
 
     @property
     def filename(self):
         return f"Dockerfile-{self.name}"
 
+    @property
+    def uses_base_image(self) -> bool:
+        """
+        Optimized images are self-contained, only standard ones build on `BaseImage`
+        """
+        return self.dockerfile_mode == DockerfileMode.standard
+
+
+@dataclass(frozen=True)
+class BaseImage:
+    """
+    Image with the runtime shared by all images of a project:
+    the `modules/` package and the packages of `pipfile_template`
+    """
+
+    repository: str
+    ecr_endpoint: str
+    python_version: str = "3.7.4"
+    tag: str = "latest"
+    name = "base"
 
-@dataclass
+    @property
+    def uri(self):
+        return f"{self.ecr_endpoint}/{self.repository}:{self.tag}"
+
+    @property
+    def filename(self):
+        return f"Dockerfile-{self.name}"
+
+
+@dataclass(frozen=True)
 class ContainerDeployment:
     """
     A container deployment specifies how a single Docker image is deployed
@@ -80,25 +147,44 @@ class ContainerDeployment:
         return f"/aws/ecs/{self.task_name}/{self.image.name}/{self.image.environment}"
 
 
-@dataclass
+def unique_images(tasks: List["EcsTask"]) -> Dict[str, List[DockerImage]]:
+    """
+    Images of all tasks grouped by name, in the order they first appear.
+    Images with the same name share a Dockerfile, so they are built once.
+    """
+    images = {}
+    for task in tasks:
+        for deployment in task.container_deployments:
+            same_name = images.setdefault(deployment.image.name, [])
+            if deployment.image not in same_name:
+                same_name.append(deployment.image)
+    return images
+
+
+@dataclass(frozen=True)
 class Pipeline(abc.ABC):
     pass
 
 
-@dataclass
+@dataclass(frozen=True)
 class DockerbuildPipeline(Pipeline):
-    unittest_subnets: List[str]
-    unittest_security_groups: List[str]
+    unittest_subnets: Tuple[str, ...]
+    unittest_security_groups: Tuple[str, ...]
 
 
-@dataclass
+@dataclass(frozen=True)
 class DeployPipeline(Pipeline):
-    service_name: str
-    unittest_subnets: List[str]
-    unittest_security_groups: List[str]
+    """
+    Builds the images of a service and rolls out a new deployment of
+    `service_name`, by default the service of the task
+    """
 
+    unittest_subnets: Tuple[str, ...]
+    unittest_security_groups: Tuple[str, ...]
+    service_name: str = None
 
-@dataclass
+
+@dataclass(frozen=True)
 class EcsTask(abc.ABC):
     """
     A task is one or more container deployments
@@ -109,33 +195,105 @@ class EcsTask(abc.ABC):
     cpu: int
     memory: int
     region: str
-    container_deployments: List[ContainerDeployment]
-    subnets: List[str]
-    security_groups: Tuple[str]
+    container_deployments: Tuple[ContainerDeployment, ...]
+    subnets: Tuple[str, ...]
+    security_groups: Tuple[str, ...]
 
 
-@dataclass
+@dataclass(frozen=True)
 class EcsScheduledTask(EcsTask):
     """
-    A scheduled task
+    A scheduled task. With a `shard_count` above one, every tick starts that
+    many copies of the task, which tell their shard apart by the
+    `SHARD_INDEX` and `SHARD_COUNT` environment variables.
+
+    `group` selects the Terraform state of the task when a project splits
+    its states by group.
     """
 
     schedule_expression: str
     pipeline: DockerbuildPipeline = None
+    shard_count: int = 1
+    group: str = None
     task_type = TaskType.scheduled
 
+    def __post_init__(self):
+        if self.shard_count < 1:
+            raise ValueError(f"shard_count of {self.name} must be at least 1")
+
+    @property
+    def shards(self) -> Tuple[int, ...]:
+        """
+        Indexes of the shards, or `(None,)` for a task that is not sharded
+        """
+        if self.shard_count == 1:
+            return (None,)
+        return tuple(range(self.shard_count))
+
 
-# @dataclass
-# class EcsServiceTask:
-#     """
-#     A task is one or more container deployments
-#     """
-#
-#     name: str
-#     environment: str
-#     cpu: int
-#     memory: int
-#     region: str
-#     container_deployments: List[ContainerDeployment]
-#     subnets: List[str] = ()
-# security_groups: Tuple[str] = ()
+@dataclass(frozen=True)
+class LoadBalancer:
+    """
+    Registers a container of a service with an existing target group
+    """
+
+    target_group_arn: str
+    container_name: str
+    container_port: int
+
+
+@dataclass(frozen=True)
+class Autoscaling:
+    """
+    Target-tracking autoscaling of the number of tasks of a service.
+    `resource_label` identifies the target group for `ScalingMetric.requests`,
+    as `app/<load-balancer>/<id>/targetgroup/<target-group>/<id>`.
+    """
+
+    min_count: int
+    max_count: int
+    metric: ScalingMetric = ScalingMetric.cpu
+    target_value: int = 70
+    scale_in_cooldown: int = 300
+    scale_out_cooldown: int = 60
+    resource_label: str = None
+
+    def __post_init__(self):
+        if not 0 <= self.min_count <= self.max_count:
+            raise ValueError(
+                f"min_count {self.min_count} and max_count {self.max_count} "
+                "must satisfy 0 <= min_count <= max_count"
+            )
+        if self.metric == ScalingMetric.requests and not self.resource_label:
+            raise ValueError("scaling on requests needs a resource_label")
+
+
+@dataclass(frozen=True)
+class EcsServiceTask(EcsTask):
+    """
+    A long-running service, with `desired_count` tasks unless it is autoscaled
+    """
+
+    desired_count: int = 1
+    autoscaling: Autoscaling = None
+    load_balancer: LoadBalancer = None
+    pipeline: DeployPipeline = None
+    task_type = TaskType.service
+
+    def __post_init__(self):
+        scaling = self.autoscaling
+        if scaling is None:
+            return
+        if not scaling.min_count <= self.desired_count <= scaling.max_count:
+            raise ValueError(
+                f"desired_count {self.desired_count} of {self.name} is outside "
+                f"{scaling.min_count} to {scaling.max_count}"
+            )
+        if scaling.metric == ScalingMetric.requests and self.load_balancer is None:
+            raise ValueError(f"{self.name} scales on requests but has no load_balancer")
+
+    @property
+    def service_name(self) -> str:
+        if self.pipeline is not None and self.pipeline.service_name:
+            return self.pipeline.service_name
+        return f"{self.name}-{self.environment}"
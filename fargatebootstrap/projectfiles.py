@@ -3,18 +3,25 @@ import json
 import yaml
 import os
 from dataclasses import dataclass
-from typing import List
-
-from .projectdata import EcsTask, ProjectConfig, DockerImage, FileType
-
-from .templates import (
-    dockerfile_template,
-    pipfile_template,
-    python_batch_script,
-    makefile_template,
-    scheduled_task_template,
+from typing import List, Tuple
+
+from . import instrumentation
+from .projectdata import (
+    BaseImage,
+    DeployPipeline,
+    EcsServiceTask,
+    EcsTask,
+    ProjectConfig,
+    DockerImage,
+    DockerfileMode,
+    FileType,
+    ScalingMetric,
+    ScriptSkeleton,
+    unique_images,
 )
 
+from .templates import render
+
 
 class FileBase(abc.ABC):
     def dump(self) -> str:
@@ -22,32 +29,41 @@ class FileBase(abc.ABC):
         improve this. I don't want to have to pass folders and filenames.
         At least it should be handled by some other class.
         """
-        if self.filetype == FileType.yaml:
-            dumped = yaml.dump(self.document, default_flow_style=False)
-        elif self.filetype == FileType.json:
-            dumped = json.dumps(self.document)
-        elif self.filetype in [
-            FileType.dockerfile,
-            FileType.pipfile,
-            FileType.python,
-            FileType.makefile,
-            FileType.terraform,
-        ]:
-            return self.document
-        else:
-            raise NotImplementedError()
+        with instrumentation.stage(self, "document") as stage:
+            document = self.document
+            if isinstance(document, str):
+                stage["size"] = len(document)
+        with instrumentation.stage(self, "dump") as stage:
+            if self.filetype == FileType.yaml:
+                dumped = yaml.dump(document, default_flow_style=False)
+            elif self.filetype == FileType.json:
+                dumped = json.dumps(document)
+            elif self.filetype in [
+                FileType.dockerfile,
+                FileType.pipfile,
+                FileType.python,
+                FileType.makefile,
+                FileType.terraform,
+                FileType.dockerignore,
+            ]:
+                dumped = document
+            else:
+                raise NotImplementedError()
+            stage["size"] = len(dumped)
         return dumped
 
     def write(self, dumped: str):
-        folder, filename = os.path.split(self.filepath)
-        if folder:
-            os.makedirs(folder, exist_ok=True)
-        if not os.path.exists(self.filepath) or self.overwrite_ok:
-            print(f"Writing file {self.filepath}")
-            with open(self.filepath, "w") as f:
-                f.write(dumped)
-        else:
-            print(f"File already exists. {self.filepath}")
+        with instrumentation.stage(self, "write") as stage:
+            folder, filename = os.path.split(self.filepath)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            if not os.path.exists(self.filepath) or self.overwrite_ok:
+                print(f"Writing file {self.filepath}")
+                with open(self.filepath, "w") as f:
+                    f.write(dumped)
+                stage["size"] = len(dumped)
+            else:
+                print(f"File already exists. {self.filepath}")
 
     @property
     @abc.abstractmethod
@@ -69,6 +85,13 @@ class FileBase(abc.ABC):
     def overwrite_ok(self) -> bool:
         pass
 
+    @property
+    def depends_on(self) -> Tuple[str, ...]:
+        """
+        Paths of the generated files that this file refers to
+        """
+        return ()
+
 
 class BuildspecTestFile(FileBase):
     # TODO implement this
@@ -81,54 +104,187 @@ class BuildspecDockerbuildFile(FileBase):
     - logs into AWS ECR
     - builds Docker image
     - pushes Docker image to ECR
+
+    Images are built with BuildKit. With `cache`, compose builds run in
+    parallel, and an image is only built and pushed when the hash of its
+    Dockerfile and sources is not yet a tag in ECR. The previous image is
+    pulled for `--cache-from`.
     """
 
     filetype = FileType.yaml
     overwrite_ok = True
 
-    def __init__(self, task: EcsTask, buildspec_version: str = "0.2"):
+    def __init__(
+        self,
+        task: EcsTask,
+        buildspec_version: str = "0.2",
+        base_image: BaseImage = None,
+        cache: bool = False,
+        ecs_cluster_name: str = None,
+    ):
         """
         Args:
             name: name of the project
             environment: deployment environment, typically `production` or `staging`
+            base_image: shared base image, built and pushed before the task's images
+            cache: only build and push images whose sources changed
+            ecs_cluster_name: cluster of the service that a `DeployPipeline` rolls out
+        """
+        self.task = task
+        self.buildspec_version = buildspec_version
+        self.base_image = base_image
+        self.cache = cache
+        self.ecs_cluster_name = ecs_cluster_name
+
+    changed_file = "changed_images.txt"
+
+    @classmethod
+    def _cached_phases(
+        cls, task: EcsTask, docker_compose_filename: str, base_image: BaseImage
+    ) -> dict:
+        """
+        Every changed image is written to `changed_file` as `<name> <hash>`
+        in pre_build. The build and post_build phases only act on those.
+        """
+        images = list(unique_images([task]).values())
+        images = [same_name[0] for same_name in images]
+        uses_base = base_image is not None and any(
+            image.uses_base_image for image in images
+        )
+
+        pre_build = [
+            "$(aws ecr get-login --no-include-email --region ap-northeast-1)",
+            f": > {cls.changed_file}",
+        ]
+        if uses_base:
+            base_inputs = ["containers/base", "containers/modules"]
+            pre_build.append(cls._check_changed(base_image, base_inputs))
+        for image in images:
+            inputs = [f"containers/{image.name}", "containers/modules"]
+            if uses_base and image.uses_base_image:
+                inputs += [
+                    f"containers/{base_image.filename}",
+                    f"containers/{base_image.filename}.dockerignore",
+                    "containers/base",
+                ]
+            pre_build.append(cls._check_changed(image, inputs))
+
+        build, post_build = [], []
+        if uses_base:
+            build.append(
+                f"if grep -q '^{base_image.name} ' {cls.changed_file}; then "
+                f"docker build --cache-from {base_image.uri} "
+                f"--build-arg BUILDKIT_INLINE_CACHE=1 "
+                f"-f containers/{base_image.filename} -t {base_image.uri} containers/; fi"
+            )
+            post_build.append(cls._push_changed(base_image))
+        changed = (
+            f"grep -v '^{base_image.name} ' {cls.changed_file}"
+            if uses_base
+            else f"cat {cls.changed_file}"
+        )
+        build.append(
+            f"SERVICES=$({changed} | cut -d' ' -f1 | tr '\\n' ' '); "
+            f'if [ -n "$SERVICES" ]; then '
+            f"docker-compose -f {docker_compose_filename} build --parallel $SERVICES; fi"
+        )
+        post_build.extend(cls._push_changed(image) for image in images)
+        return {
+            "pre_build": {"commands": pre_build},
+            "build": {"commands": build},
+            "post_build": {"commands": post_build},
+        }
+
+    @classmethod
+    def _check_changed(cls, image, inputs: List[str]) -> str:
+        """
+        Hash the Dockerfile, .dockerignore and sources of `image`, and mark the
+        image as changed if ECR has no image tagged with that hash.
+        The previous image is pulled so that its layers can be reused.
         """
+        dockerfile = f"containers/{image.filename}"
+        paths = " ".join([dockerfile, f"{dockerfile}.dockerignore"] + inputs)
+        return (
+            f"HASH=$(find {paths} -type f ! -name '*.pyc' | sort "
+            f"| xargs sha256sum | sha256sum | cut -c1-16); "
+            f"if aws ecr describe-images --repository-name {image.repository} "
+            f"--image-ids imageTag=src-$HASH > /dev/null 2>&1; "
+            f'then echo "{image.name} unchanged"; '
+            f'else echo "{image.name} $HASH" >> {cls.changed_file}; '
+            f"docker pull {image.uri} || true; fi"
+        )
+
+    @classmethod
+    def _push_changed(cls, image) -> str:
+        """
+        Push a changed image, also tagged with its source hash
+        """
+        src_uri = f"{image.uri.rsplit(':', 1)[0]}:src-$HASH"
+        return (
+            f"HASH=$(grep '^{image.name} ' {cls.changed_file} | cut -d' ' -f2); "
+            f'if [ -n "$HASH" ]; then docker push {image.uri} '
+            f"&& docker tag {image.uri} {src_uri} && docker push {src_uri}; fi"
+        )
+
+    @property
+    def document(self):
+        task, base_image = self.task, self.base_image
         name, environment = task.name, task.environment
 
-        docker_compose_filename = f"docker-compose-{name}-{environment}-fargate.yml"
+        docker_compose_filename = f"docker-compose-{name}-{environment}.yml"
         imagedefinitions_filename = f"imagedefinitions_{name}-{environment}.json"
         imagedefinitions = [
             {"name": f"{name}", "imageUri": deployment.image.uri}
             for deployment in task.container_deployments
         ]
 
-        phases = {
-            "pre_build": {
-                "commands": [
-                    "$(aws ecr get-login --no-include-email --region ap-northeast-1)"
-                ]
-            },
-            "build": {
-                "commands": [f"docker-compose -f {docker_compose_filename} build"]
-            },
-            "post_build": [
-                f"docker-compose -f {docker_compose_filename} push",
-                f"printf {json.dumps(imagedefinitions)} > {imagedefinitions_filename}",
-            ],
-        }
+        if self.cache:
+            phases = self._cached_phases(task, docker_compose_filename, base_image)
+        else:
+            phases = {
+                "pre_build": {
+                    "commands": [
+                        "$(aws ecr get-login --no-include-email --region ap-northeast-1)"
+                    ]
+                },
+                "build": {
+                    "commands": [f"docker-compose -f {docker_compose_filename} build"]
+                },
+                "post_build": {
+                    "commands": [f"docker-compose -f {docker_compose_filename} push"]
+                },
+            }
+            if base_image is not None:
+                phases["build"]["commands"].insert(
+                    0,
+                    f"docker build -f containers/{base_image.filename} "
+                    f"-t {base_image.uri} containers/",
+                )
+                phases["post_build"]["commands"].insert(
+                    0, f"docker push {base_image.uri}"
+                )
+        phases["post_build"]["commands"].append(
+            f"printf {json.dumps(imagedefinitions)} > {imagedefinitions_filename}"
+        )
+        if isinstance(task.pipeline, DeployPipeline):
+            # the service runs the `tag` of its images, so a new deployment
+            # pulls the images that were just pushed
+            phases["post_build"]["commands"].append(
+                f"aws ecs update-service --region {task.region} "
+                f"--cluster {self.ecs_cluster_name} --service {task.service_name} "
+                f"--force-new-deployment"
+            )
 
         document = {
-            "version": buildspec_version,
+            "version": self.buildspec_version,
             "phases": phases,
             "artifacts": {"files": imagedefinitions_filename},
         }
-        self.task = task
-        self._imagedefinitions = imagedefinitions
-        self._phases = phases
-        self._document = document
-
-    @property
-    def document(self):
-        return self._document
+        # BuildKit is needed for the per-image .dockerignore files
+        document["env"] = {
+            "variables": {"DOCKER_BUILDKIT": "1", "COMPOSE_DOCKER_CLI_BUILD": "1"}
+        }
+        return document
 
     @property
     def filepath(self):
@@ -140,11 +296,28 @@ class ContainerDefinitionsFile(FileBase):
     filetype = FileType.json
     overwrite_ok = True
 
-    def __init__(self, task: EcsTask):
+    def __init__(self, task: EcsTask, shard_index: int = None):
         """
         Defines a task to be run in ecs in `region`.
         Logs are sent to `awslogs_group` in CloudWatch.
+
+        The definitions of a shard of a sharded task get its `SHARD_INDEX`
+        and `SHARD_COUNT`, and a log group per shard.
         """
+        self.task = task
+        self.shard_index = shard_index
+
+    @property
+    def suffix(self) -> str:
+        return "" if self.shard_index is None else f"-shard{self.shard_index}"
+
+    @property
+    def log_suffix(self) -> str:
+        return "" if self.shard_index is None else f"/shard{self.shard_index}"
+
+    @property
+    def document(self):
+        task = self.task
         # TODO add support for custom Docker tags
         tasks = [
             {
@@ -165,7 +338,7 @@ class ContainerDefinitionsFile(FileBase):
                 "logConfiguration": {
                     "logDriver": "awslogs",
                     "options": {
-                        "awslogs-group": deployment.awslogs_group,
+                        "awslogs-group": deployment.awslogs_group + self.log_suffix,
                         "awslogs-region": task.region,
                         "awslogs-stream-prefix": "ecs",
                     },
@@ -177,16 +350,39 @@ class ContainerDefinitionsFile(FileBase):
             }
             for deployment in task.container_deployments
         ]
-        self.task = task
-        self._document = tasks
+        load_balancer = getattr(task, "load_balancer", None)
+        deployment_skeletons = {
+            deployment.image.name: deployment.image.script_skeleton
+            for deployment in task.container_deployments
+        }
+        for definition in tasks:
+            if load_balancer and definition["name"] == load_balancer.container_name:
+                definition["portMappings"] = [
+                    {"containerPort": load_balancer.container_port, "protocol": "tcp"}
+                ]
+            if deployment_skeletons[definition["name"]] == ScriptSkeleton.process_pool:
+                # sizes the process pool of the script
+                definition["environment"].append(
+                    {"name": "TASK_CPU", "value": str(task.cpu)}
+                )
+            if self.shard_index is not None:
+                definition["environment"] += [
+                    {"name": "SHARD_INDEX", "value": str(self.shard_index)},
+                    {"name": "SHARD_COUNT", "value": str(task.shard_count)},
+                ]
+        return tasks
 
     @property
-    def document(self):
-        return self._document
+    def filepath(self):
+        return f"terraform/container_definitions/container_definitions-{self.task.name}-{self.task.environment}{self.suffix}.json"
 
     @property
-    def filepath(self):
-        return f"terraform/container_definitions/container_definitions-{self.task.name}-{self.task.environment}.json"
+    def terraform_path(self):
+        """
+        The path relative to the terraform folder, which the modules read it from
+        """
+        folder, filename = os.path.split(self.filepath)
+        return os.path.join(*os.path.split(folder)[1:], filename)
 
 
 class DockerComposeFile(FileBase):
@@ -204,13 +400,26 @@ class DockerComposeFile(FileBase):
         task: EcsTask,
         build_context: str = "containers/",  # TODO remove default value. Should be managed be abstraction.
         compose_version: str = "3.2",
+        cache: bool = False,
     ):
+        """
+        With `cache`, the images are built with an inline layer cache and reuse
+        the layers of the previously pushed image.
+        """
+        self.task = task
+        self.build_context = build_context
+        self.compose_version = compose_version
+        self.cache = cache
+
+    @property
+    def document(self):
+        task = self.task
         services = {
-            "version": compose_version,
+            "version": self.compose_version,
             "services": {
                 deployment.image.name: {
                     "build": {
-                        "context": build_context,
+                        "context": self.build_context,
                         "dockerfile": deployment.image.filename,
                     },
                     "image": deployment.image.uri,
@@ -221,37 +430,154 @@ class DockerComposeFile(FileBase):
                 for deployment in task.container_deployments
             },
         }
-        self.task = task
-        self._document = services
-
-    @property
-    def document(self):
-        return self._document
+        if self.cache:
+            for deployment in task.container_deployments:
+                services["services"][deployment.image.name]["build"].update(
+                    {
+                        "cache_from": [deployment.image.uri],
+                        "args": {"BUILDKIT_INLINE_CACHE": "1"},
+                    }
+                )
+        return services
 
     @property
     def filepath(self):
         return f"docker-compose-{self.task.name}-{self.task.environment}.yml"
 
+    @property
+    def depends_on(self):
+        return tuple(
+            os.path.join(self.build_context, deployment.image.filename)
+            for deployment in self.task.container_deployments
+        )
+
 
 @dataclass
 class DockerFile(FileBase):
+    """
+    With a `base_image`, standard images are built on top of the shared base
+    instead of installing the common runtime themselves.
+    """
 
     image: DockerImage
     script_name: str = "main"
     python_version: str = "3.7.4"
+    base_image: BaseImage = None
 
     filetype = FileType.dockerfile
     overwrite_ok = True
-    dockerfile = dockerfile_template
+    dockerfile = "Dockerfile.j2"
+    optimized_dockerfile = "Dockerfile-optimized.j2"
+    service_dockerfile = "Dockerfile-service.j2"
+
+    @property
+    def uses_base_image(self) -> bool:
+        return self.base_image is not None and self.image.uses_base_image
+
+    @property
+    def copies_modules(self) -> bool:
+        """
+        Images built on the base image get `modules/` from it
+        """
+        return (
+            self.image.dockerfile_mode == DockerfileMode.optimized
+            or not self.uses_base_image
+        )
 
     @property
     def document(self):
-        return self.dockerfile.render(image=self.image)
+        if self.image.dockerfile_mode == DockerfileMode.optimized:
+            return render(self.optimized_dockerfile, image=self.image)
+        if self.uses_base_image:
+            return render(
+                self.service_dockerfile, image=self.image, base=self.base_image
+            )
+        return render(self.dockerfile, image=self.image)
 
     @property
     def filepath(self):
         return f"containers/Dockerfile-{self.image.name}"
 
+    @property
+    def depends_on(self):
+        dependencies = (
+            Pipfile(self.image).filepath,
+            PythonScriptFile(self.image).filepath,
+        )
+        if self.uses_base_image:
+            dependencies += (BaseDockerFile(self.base_image).filepath,)
+        return dependencies
+
+
+@dataclass
+class BaseDockerFile(FileBase):
+    base_image: BaseImage
+
+    filetype = FileType.dockerfile
+    overwrite_ok = True
+    dockerfile = "Dockerfile-base.j2"
+
+    @property
+    def document(self):
+        return render(self.dockerfile, base=self.base_image)
+
+    @property
+    def filepath(self):
+        return f"containers/{self.base_image.filename}"
+
+    @property
+    def depends_on(self):
+        return (Pipfile(self.base_image).filepath,)
+
+
+@dataclass
+class DockerIgnoreFile(FileBase):
+    """
+    Limits the build context of an image to its own folder, and `modules/`
+    if its Dockerfile copies them. BuildKit reads `<Dockerfile>.dockerignore`
+    instead of `containers/.dockerignore`, so every image has its own.
+    """
+
+    image: DockerImage
+    modules: bool = True
+
+    filetype = FileType.dockerignore
+    overwrite_ok = True
+    template = "dockerignore.j2"
+
+    @property
+    def document(self):
+        return render(self.template, image=self.image, modules=self.modules)
+
+    @property
+    def filepath(self):
+        return f"containers/{self.image.filename}.dockerignore"
+
+    @property
+    def depends_on(self):
+        return (f"containers/{self.image.filename}",)
+
+
+@dataclass
+class TerraformBaseImageFile(FileBase):
+    """
+    ECR repository for the shared base image
+    """
+
+    base_image: BaseImage
+
+    filetype = FileType.terraform
+    overwrite_ok = True
+    template = "base_image_repository.tf.j2"
+
+    @property
+    def document(self):
+        return render(self.template, base=self.base_image)
+
+    @property
+    def filepath(self):
+        return f"terraform/{self.base_image.repository}.tf"
+
 
 @dataclass
 class Pipfile(FileBase):
@@ -260,11 +586,11 @@ class Pipfile(FileBase):
 
     filetype = FileType.pipfile
     overwrite_ok = False
-    pipfile = pipfile_template
+    pipfile = "Pipfile.j2"
 
     @property
     def document(self):
-        return self.pipfile.render(python_version=self.python_version)
+        return render(self.pipfile, python_version=self.python_version)
 
     @property
     def filepath(self):
@@ -277,11 +603,16 @@ class PythonScriptFile(FileBase):
 
     filetype = FileType.python
     overwrite_ok = False
-    script = python_batch_script
+    script = "batch_script.py.j2"
+    skeletons = {
+        ScriptSkeleton.asyncio: "batch_script_asyncio.py.j2",
+        ScriptSkeleton.process_pool: "batch_script_process_pool.py.j2",
+    }
 
     @property
     def document(self):
-        return self.script.render(image=self.image)
+        script = self.skeletons.get(self.image.script_skeleton, self.script)
+        return render(script, image=self.image)
 
     @property
     def filepath(self):
@@ -291,14 +622,22 @@ class PythonScriptFile(FileBase):
 @dataclass
 class MakeFile(FileBase):
     tasks: List[EcsTask]
+    base_image: BaseImage = None
+    terraform_folders: Tuple[str, ...] = ("terraform",)
 
     filetype = FileType.makefile
     overwrite_ok = True
-    template = makefile_template
+    template = "Makefile.j2"
 
     @property
     def document(self):
-        return self.template.render(tasks=self.tasks)
+        return render(
+            self.template,
+            tasks=self.tasks,
+            images=unique_images(self.tasks),
+            base=self.base_image,
+            terraform_folders=self.terraform_folders,
+        )
 
     @property
     def filepath(self):
@@ -307,34 +646,189 @@ class MakeFile(FileBase):
 
 @dataclass
 class TerraformScheduledTaskFile(FileBase):
+    """
+    A sharded task gets a scheduled task module per shard, each with the
+    container definitions in `shard_files`
+    """
+
     task: EcsTask
     project_config: ProjectConfig
     container_definitions_file: ContainerDefinitionsFile
     schedule_expression: str
+    shard_files: Tuple[ContainerDefinitionsFile, ...] = ()
 
     filetype = FileType.terraform
     overwrite_ok = True
-    template = scheduled_task_template
+    template = "scheduled_task.tf.j2"
 
     @property
     def document(self):
-        # create the filepath to the container definitions file
-        # so that the terraform module can read it.
-        cd_folder, cd_filename = os.path.split(self.container_definitions_file.filepath)
-        cd_filepath = os.path.join(*os.path.split(cd_folder)[1:], cd_filename)
-        return self.template.render(
+        pipeline = self.task.pipeline
+        shards = [
+            {
+                "suffix": cdf.suffix,
+                "var_suffix": cdf.suffix.replace("-", "_"),
+                "log_suffix": cdf.log_suffix,
+                "container_definitions_filename": cdf.terraform_path,
+            }
+            for cdf in self.shard_files or (self.container_definitions_file,)
+        ]
+        return render(
+            self.template,
             task=self.task,
             project_config=self.project_config,
             schedule_expression=self.schedule_expression,
-            container_definitions_filename=cd_filepath,
+            shards=shards,
+            subnets=json.dumps(self.task.subnets),
+            security_groups=json.dumps(self.task.security_groups),
+            # the CICD module is only rendered for tasks with a pipeline
+            unittest_subnets=json.dumps(pipeline and pipeline.unittest_subnets),
+            unittest_security_groups=json.dumps(
+                pipeline and pipeline.unittest_security_groups
+            ),
+        )
+
+    @property
+    def filepath(self):
+        return f"terraform/{self.task.name}-{self.task.environment}.tf"
+
+    @property
+    def depends_on(self):
+        return tuple(
+            cdf.filepath
+            for cdf in self.shard_files or (self.container_definitions_file,)
+        )
+
+
+@dataclass
+class TerraformTaskMapFile(FileBase):
+    """
+    The `scheduled_tasks` and `pipelines` maps of a `TerraformScheduledTasksFile`,
+    with an entry per container definitions file, i.e. per task or shard
+    """
+
+    container_definitions_files: List[ContainerDefinitionsFile]
+    folder: str = "terraform"
+
+    filetype = FileType.json
+    overwrite_ok = True
+    filename = "scheduled_tasks.auto.tfvars.json"
+
+    @property
+    def document(self):
+        # paths are relative to the folder that terraform runs in
+        terraform_dir = os.path.relpath("terraform", self.folder)
+        scheduled_tasks, pipelines = {}, {}
+        for cdf in self.container_definitions_files:
+            task = cdf.task
+            key = f"{task.name}_{task.environment}"
+            scheduled_tasks[key + cdf.suffix.replace("-", "_")] = {
+                "name": task.name + cdf.suffix,
+                "environment": task.environment,
+                "cpu": str(task.cpu),
+                "memory": str(task.memory),
+                "schedule_expression": task.schedule_expression,
+                "container_definitions": os.path.normpath(
+                    os.path.join(terraform_dir, cdf.terraform_path)
+                ),
+                "log_groups": {
+                    deployment.image.name: deployment.awslogs_group + cdf.log_suffix
+                    for deployment in task.container_deployments
+                },
+                "subnets": list(task.subnets),
+                "security_groups": list(task.security_groups),
+            }
+            if task.pipeline is not None:
+                pipelines[key] = {
+                    "name": task.name,
+                    "environment": task.environment,
+                    "dockerbuild_buildspec_path": f"buildspec/buildspec-dockerbuild-{task.name}-{task.environment}.yml",
+                    "unittest_buildspec_path": f"buildspec/buildspec-unittest-{task.name}-allenvs.yml",
+                    "unittest_subnets": list(task.pipeline.unittest_subnets),
+                    "unittest_security_groups": list(
+                        task.pipeline.unittest_security_groups
+                    ),
+                }
+        return {"scheduled_tasks": scheduled_tasks, "pipelines": pipelines}
+
+    @property
+    def filepath(self):
+        return os.path.join(self.folder, self.filename)
+
+    @property
+    def depends_on(self):
+        return tuple(cdf.filepath for cdf in self.container_definitions_files)
+
+
+@dataclass
+class TerraformScheduledTasksFile(FileBase):
+    """
+    All scheduled tasks in `folder` as a single `for_each` module, and their
+    pipelines as another, over the maps of the `TerraformTaskMapFile` next to it
+    """
+
+    project_config: ProjectConfig
+    folder: str = "terraform"
+
+    filetype = FileType.terraform
+    overwrite_ok = True
+    template = "scheduled_tasks.tf.j2"
+
+    @property
+    def document(self):
+        return render(self.template, project_config=self.project_config)
+
+    @property
+    def filepath(self):
+        return os.path.join(self.folder, "scheduled_tasks.tf")
+
+    @property
+    def depends_on(self):
+        return (os.path.join(self.folder, TerraformTaskMapFile.filename),)
+
+
+@dataclass
+class TerraformServiceFile(FileBase):
+    """
+    A long-running ECS service, with target-tracking autoscaling when the
+    task has `autoscaling`
+    """
+
+    task: EcsServiceTask
+    project_config: ProjectConfig
+    container_definitions_file: ContainerDefinitionsFile
+
+    filetype = FileType.terraform
+    overwrite_ok = True
+    template = "ecs_service.tf.j2"
+    metric_types = {
+        ScalingMetric.cpu: "ECSServiceAverageCPUUtilization",
+        ScalingMetric.memory: "ECSServiceAverageMemoryUtilization",
+        ScalingMetric.requests: "ALBRequestCountPerTarget",
+    }
+
+    @property
+    def document(self):
+        pipeline = self.task.pipeline
+        autoscaling = self.task.autoscaling
+        return render(
+            self.template,
+            task=self.task,
+            project_config=self.project_config,
+            container_definitions_filename=self.container_definitions_file.terraform_path,
             subnets=json.dumps(self.task.subnets),
             security_groups=json.dumps(self.task.security_groups),
-            unittest_subnets=json.dumps(self.task.pipeline.unittest_subnets),
+            metric_type=autoscaling and self.metric_types[autoscaling.metric],
+            unittest_subnets=json.dumps(pipeline and pipeline.unittest_subnets),
             unittest_security_groups=json.dumps(
-                self.task.pipeline.unittest_security_groups
+                pipeline and pipeline.unittest_security_groups
             ),
         )
 
     @property
     def filepath(self):
         return f"terraform/{self.task.name}-{self.task.environment}.tf"
+
+    @property
+    def depends_on(self):
+        return (self.container_definitions_file.filepath,)
@@ -0,0 +1,196 @@
+"""
+Runs the scripts of a task locally, under limits like those of its Fargate
+task, without Docker:
+
+- every container is pinned to the same `ceil(cpu / 1024)` cores with
+  `sched_setaffinity`
+- the address space of every container is limited to `memory` MiB with
+  `RLIMIT_AS`
+
+Cores can only be given whole, so tasks with less than one vCPU get one
+core. The address space includes memory that is reserved but never used,
+so the memory limit is somewhat stricter than on Fargate, but it applies to
+each container rather than to the task as a whole.
+
+The containers of a task run side by side, as on Fargate where they share
+the task's cpu and memory, and are measured together as one task run: the
+wall time until the last container exits, their summed cpu time, the sum of
+their peak RSS and their peak cpu. The peak cpu is the highest rate of cpu
+use over a sampling interval, read from `/proc`; where `/proc` is missing
+it falls back to the average. The results can be appended to a usage CSV,
+one row per task run, the input of the right-sizing advisor in `sizing.py`.
+"""
+import csv
+import math
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, fields
+from typing import List, Optional
+
+from .projectdata import ContainerDeployment, EcsTask
+
+
+@dataclass
+class RunResult:
+    task: str
+    environment: str
+    image: str
+    returncode: int
+    wall_seconds: float
+    cpu_seconds: float
+    # highest cpu units used over a sampling interval, 1024 per fully used core
+    peak_cpu: float
+    # sum of the peak RSS of the containers in MiB
+    peak_memory: float
+
+    def summary(self) -> str:
+        return (
+            f"{self.task}/{self.image}: exit {self.returncode}, "
+            f"{self.wall_seconds:.2f}s wall, {self.cpu_seconds:.2f}s cpu "
+            f"({self.peak_cpu:.0f} cpu units), {self.peak_memory:.0f} MiB peak RSS"
+        )
+
+
+def cores_for(task: EcsTask) -> List[int]:
+    available = sorted(os.sched_getaffinity(0))
+    return available[: max(math.ceil(task.cpu / 1024), 1)]
+
+
+def _limit(cores: List[int], memory_bytes: int):
+    """
+    Returns the function that applies the limits in the child process
+    """
+
+    def limit():
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+    return limit
+
+
+class CpuSampler(threading.Thread):
+    """
+    Samples the cpu time of running processes and keeps the highest rate
+    """
+
+    def __init__(self, pids: List[int], interval: float = 0.1):
+        super().__init__(daemon=True)
+        self.pids = pids
+        self.interval = interval
+        self.peak = 0.0
+        self.stopped = threading.Event()
+
+    @staticmethod
+    def cpu_seconds(pid: int) -> Optional[float]:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                stat = f.read()
+        except OSError:
+            return None
+        # the fields after the parenthesised command name, starting at state;
+        # utime, stime, cutime and cstime are fields 14 to 17
+        times = stat.rsplit(")", 1)[1].split()[11:15]
+        return sum(int(t) for t in times) / os.sysconf("SC_CLK_TCK")
+
+    def total(self) -> Optional[float]:
+        seconds = [self.cpu_seconds(pid) for pid in self.pids]
+        seconds = [s for s in seconds if s is not None]
+        return sum(seconds) if seconds else None
+
+    def run(self):
+        last, last_time = self.total(), time.perf_counter()
+        while last is not None and not self.stopped.wait(self.interval):
+            now, now_time = self.total(), time.perf_counter()
+            if now is None:
+                break
+            self.peak = max(self.peak, (now - last) / (now_time - last_time) * 1024)
+            last, last_time = now, now_time
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def start_deployment(
+    task: EcsTask,
+    deployment: ContainerDeployment,
+    containers_dir: str = "containers",
+    environment: dict = None,
+) -> subprocess.Popen:
+    """
+    Start the script of one container of `task`
+    """
+    image = deployment.image
+    package = containers_dir.strip("/").replace("/", ".")
+    module = f"{package}.{image.name}.{image.script_name}"
+    env = dict(os.environ, TASK_CPU=str(task.cpu))
+    env.setdefault("RUNTIME_ENVIRONMENT", "localhost")
+    env.update(environment or {})
+    cores = cores_for(task) if hasattr(os, "sched_getaffinity") else []
+    return subprocess.Popen(
+        [sys.executable, "-m", module],
+        env=env,
+        preexec_fn=_limit(cores, task.memory * 2 ** 20),
+    )
+
+
+def run_task(task: EcsTask, image: Optional[str] = None, **options) -> RunResult:
+    """
+    Run the scripts of the containers of `task` side by side, or only the one
+    of `image`, and measure them together as one task run
+    """
+    deployments = [
+        deployment
+        for deployment in task.container_deployments
+        if image is None or deployment.image.name == image
+    ]
+    if not deployments:
+        raise ValueError(f"{task.name} has no container with image {image}")
+
+    start = time.perf_counter()
+    processes = [
+        start_deployment(task, deployment, **options) for deployment in deployments
+    ]
+    sampler = CpuSampler([process.pid for process in processes])
+    sampler.start()
+    cpu_seconds = peak_memory = 0.0
+    for process in processes:
+        # wait4 gives the resource usage of this child only
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        cpu_seconds += usage.ru_utime + usage.ru_stime
+        # ru_maxrss is in KiB on Linux
+        peak_memory += usage.ru_maxrss / 1024
+    wall_seconds = time.perf_counter() - start
+    sampler.stop()
+
+    average_cpu = cpu_seconds / wall_seconds * 1024 if wall_seconds else 0.0
+    return RunResult(
+        task=task.name,
+        environment=task.environment,
+        image="+".join(deployment.image.name for deployment in deployments),
+        returncode=next((p.returncode for p in processes if p.returncode), 0),
+        wall_seconds=wall_seconds,
+        cpu_seconds=cpu_seconds,
+        peak_cpu=max(sampler.peak, average_cpu),
+        peak_memory=peak_memory,
+    )
+
+
+def append_usage(path: str, results: List[RunResult]):
+    """
+    Append results to a usage CSV, writing the header for a new file
+    """
+    new = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, "a", newline="") as f:
+        writer = csv.DictWriter(
+            f, fieldnames=[field.name for field in fields(RunResult)]
+        )
+        if new:
+            writer.writeheader()
+        writer.writerows(asdict(result) for result in results)
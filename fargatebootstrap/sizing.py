@@ -0,0 +1,268 @@
+"""
+Right-sizing of the cpu and memory of Fargate tasks.
+
+Fargate only accepts certain combinations of cpu units (1024 per vCPU) and
+memory (MiB), see `FARGATE_SIZES`. Given recorded usage of task runs, the
+advisor recommends the cheapest legal size that fits the peak usage plus
+some headroom.
+
+A usage profile is a CSV or JSON export with one row per task run:
+
+    task,environment,peak_cpu,peak_memory
+    foryou,production,310,870
+
+`peak_cpu` is in cpu units and `peak_memory` in MiB. `environment` can be
+left out when the task name is unique. Exports with one row per container
+need a `run` column: the rows of a task with the same run id are summed into
+one task run, since the containers of a task share its cpu and memory. Rows
+without a run id are taken to be whole task runs, like the rows written by
+`python -m fargatebootstrap run`.
+"""
+import csv
+import json
+import math
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .projectdata import EcsTask
+
+# cpu units -> legal memory sizes in MiB
+FARGATE_SIZES: Dict[int, Tuple[int, ...]] = {
+    256: (512, 1024, 2048),
+    512: tuple(range(1024, 4097, 1024)),
+    1024: tuple(range(2048, 8193, 1024)),
+    2048: tuple(range(4096, 16385, 1024)),
+    4096: tuple(range(8192, 30721, 1024)),
+    8192: tuple(range(16384, 61441, 4096)),
+    16384: tuple(range(32768, 122881, 8192)),
+}
+
+# on-demand Linux/x86 prices, used to rank the sizes that fit
+VCPU_HOUR = 0.04048
+GB_HOUR = 0.004445
+
+
+def hourly_cost(cpu: int, memory: int) -> float:
+    return cpu / 1024 * VCPU_HOUR + memory / 1024 * GB_HOUR
+
+
+def check_size(cpu: int, memory: int) -> Optional[str]:
+    """
+    None if `cpu` and `memory` is a legal Fargate size, otherwise the reason
+    """
+    if cpu not in FARGATE_SIZES:
+        return f"cpu must be one of {', '.join(map(str, FARGATE_SIZES))}, not {cpu}"
+    legal = FARGATE_SIZES[cpu]
+    if memory not in legal:
+        return (
+            f"memory for {cpu} cpu units must be one of "
+            f"{', '.join(map(str, legal))} MiB, not {memory}"
+        )
+    return None
+
+
+def smallest_size(cpu: float, memory: float) -> Optional[Tuple[int, int]]:
+    """
+    The cheapest legal size with at least `cpu` units and `memory` MiB
+    """
+    fitting = [
+        (c, m)
+        for c, sizes in FARGATE_SIZES.items()
+        for m in sizes
+        if c >= cpu and m >= memory
+    ]
+    if not fitting:
+        return None
+    return min(fitting, key=lambda size: hourly_cost(*size))
+
+
+@dataclass
+class Usage:
+    task: str
+    environment: Optional[str]
+    peak_cpu: float
+    peak_memory: float
+    # rows with the same run id are containers of one task run
+    run: Optional[str] = None
+
+
+def read_usage(path: str) -> List[Usage]:
+    """
+    Read a usage profile from a .csv or .json file
+    """
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path) as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows["runs"]
+    usage = []
+    for i, row in enumerate(rows):
+        try:
+            usage.append(
+                Usage(
+                    task=row["task"],
+                    environment=row.get("environment") or None,
+                    peak_cpu=float(row["peak_cpu"]),
+                    peak_memory=float(row["peak_memory"]),
+                    run=str(row["run"]) if row.get("run") not in (None, "") else None,
+                )
+            )
+        except (KeyError, ValueError) as e:
+            raise ValueError(f"{path}: invalid run {i}: {e}") from None
+    return usage
+
+
+def task_runs(usage: Iterable[Usage]) -> List[Usage]:
+    """
+    Sum the container rows of each run id into one row per task run
+    """
+    whole = []
+    containers: Dict[Tuple[str, Optional[str], str], List[Usage]] = defaultdict(list)
+    for row in usage:
+        if row.run is None:
+            whole.append(row)
+        else:
+            containers[(row.task, row.environment, row.run)].append(row)
+    for (task, environment, run), rows in containers.items():
+        whole.append(
+            Usage(
+                task=task,
+                environment=environment,
+                peak_cpu=sum(row.peak_cpu for row in rows),
+                peak_memory=sum(row.peak_memory for row in rows),
+                run=run,
+            )
+        )
+    return whole
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile
+    """
+    values = sorted(values)
+    rank = max(math.ceil(p / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+@dataclass
+class Recommendation:
+    task: str
+    environment: str
+    cpu: int
+    memory: int
+    runs: int = 0
+    peak_cpu: Optional[float] = None
+    peak_memory: Optional[float] = None
+    recommended: Optional[Tuple[int, int]] = None
+    problem: Optional[str] = None
+
+    @property
+    def changed(self) -> bool:
+        return self.recommended is not None and self.recommended != (
+            self.cpu,
+            self.memory,
+        )
+
+    def summary(self) -> str:
+        line = f"{self.task} ({self.environment}): {self.cpu} cpu, {self.memory} MiB"
+        if self.problem:
+            line += f", INVALID: {self.problem}"
+        if not self.runs:
+            return line + ", no usage data"
+        line += (
+            f", peak {self.peak_cpu:.0f} cpu, {self.peak_memory:.0f} MiB "
+            f"over {self.runs} run(s)"
+        )
+        if self.recommended is None:
+            return line + ", does not fit any Fargate size"
+        if not self.changed:
+            return line + ", size is right"
+        cpu, memory = self.recommended
+        cost = hourly_cost(cpu, memory) - hourly_cost(self.cpu, self.memory)
+        return line + f" -> {cpu} cpu, {memory} MiB ({cost:+.4f} $/hour)"
+
+
+def recommend(
+    tasks: Iterable[EcsTask],
+    usage: Iterable[Usage],
+    headroom: float = 0.2,
+    p: float = 100,
+) -> List[Recommendation]:
+    """
+    Recommend a size per task from the `p`th percentile of the peaks of its
+    runs, plus `headroom`
+    """
+    runs = defaultdict(list)
+    for run in task_runs(usage):
+        runs[(run.task, run.environment)].append(run)
+    recommendations = []
+    for task in tasks:
+        task_runs = runs.get((task.name, task.environment)) or runs.get(
+            (task.name, None), []
+        )
+        recommendation = Recommendation(
+            task=task.name,
+            environment=task.environment,
+            cpu=task.cpu,
+            memory=task.memory,
+            runs=len(task_runs),
+            problem=check_size(task.cpu, task.memory),
+        )
+        if task_runs:
+            recommendation.peak_cpu = percentile([r.peak_cpu for r in task_runs], p)
+            recommendation.peak_memory = percentile(
+                [r.peak_memory for r in task_runs], p
+            )
+            recommendation.recommended = smallest_size(
+                recommendation.peak_cpu * (1 + headroom),
+                recommendation.peak_memory * (1 + headroom),
+            )
+        recommendations.append(recommendation)
+    return recommendations
+
+
+def rewrite_spec(path: str, recommendations: Iterable[Recommendation]) -> int:
+    """
+    Set the recommended cpu and memory on the tasks of a YAML or JSON spec.
+    Returns the number of tasks changed.
+
+    The spec is parsed and dumped again, so comments in a YAML spec are lost.
+    """
+    from .spec import SpecError, read_documents
+
+    extension = os.path.splitext(path)[1]
+    if extension == ".toml":
+        raise SpecError(f"{path}: TOML specs cannot be rewritten")
+    sizes = {
+        (r.task, r.environment): r.recommended for r in recommendations if r.changed
+    }
+    documents = list(read_documents(path))
+    environment = (documents[0].get("defaults") or {}).get("environment")
+
+    changed = 0
+    task_specs = list(documents[0].get("tasks") or [])
+    for document in documents[1:]:
+        task_specs.extend(document["tasks"] if "tasks" in document else [document])
+    for spec in task_specs:
+        key = (spec.get("name"), spec.get("environment", environment))
+        if key in sizes:
+            spec["cpu"], spec["memory"] = sizes[key]
+            changed += 1
+
+    with open(path, "w") as f:
+        if extension == ".json":
+            json.dump(documents[0], f, indent=2)
+            f.write("\n")
+        elif extension == ".jsonl":
+            f.writelines(json.dumps(document) + "\n" for document in documents)
+        else:
+            import yaml
+
+            yaml.safe_dump_all(documents, f, default_flow_style=False, sort_keys=False)
+    return changed
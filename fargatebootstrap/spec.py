@@ -0,0 +1,336 @@
+"""
+Project specs: the declarative alternative to building the `projectdata`
+objects by hand, as in `example.py`.
+
+A spec is YAML, JSON or TOML:
+
+    config:
+      account_id: "211367837384"
+      region: ap-northeast-1
+      vpc_name: vpc_central
+      ecs_cluster_name: persistent-cluster
+      git_repo_name: my_repo
+      git_repo_branch: production
+    project:                  # options of `Project`
+      incremental: true
+    defaults:                 # fields shared by all tasks
+      cpu: 512
+      memory: 2048
+      subnets: [subnet1, subnet2]
+      security_groups: [sg1]
+    images:                   # images referred to by name from the tasks
+      conterec:
+        script_name: conterec_async
+        description: Runs conterec service
+    tasks:
+      - name: foryou
+        environment: production
+        schedule_expression: rate(5 minutes)
+        containers:
+          - image: conterec
+          - image:
+              name: colarec
+              script_name: colarec_async
+              description: Runs colarec service
+      - name: consumer        # a long-running service
+        type: service
+        environment: production
+        autoscaling:
+          min_count: 1
+          max_count: 4
+          metric: cpu         # cpu, memory or requests
+          target_value: 70
+        containers:
+          - image: conterec
+
+Large specs can be streamed: in a multi-document YAML file (documents
+separated by `---`) or a JSON Lines file (`.jsonl`), the first document holds
+`config`, `project`, `defaults` and `images`, and every following document is
+one task. Tasks are then parsed one at a time.
+
+Images are interned, so that a task that uses the same image as an earlier
+task refers to the same `DockerImage` object.
+"""
+import dataclasses
+import json
+import os
+import sys
+from enum import IntEnum
+from typing import Iterator, Tuple, Union, get_type_hints
+
+from .projectdata import (
+    Autoscaling,
+    ContainerDeployment,
+    DeployPipeline,
+    DockerbuildPipeline,
+    DockerImage,
+    EcsScheduledTask,
+    EcsServiceTask,
+    EcsTask,
+    LoadBalancer,
+    ProjectConfig,
+    TaskType,
+)
+from .sizing import check_size
+
+HEADER_KEYS = {"config", "project", "defaults", "images", "tasks"}
+
+# the class of a task and of its pipeline, by the `type` of the task
+TASK_TYPES = {
+    TaskType.scheduled: (EcsScheduledTask, DockerbuildPipeline),
+    TaskType.service: (EcsServiceTask, DeployPipeline),
+}
+
+
+class SpecError(ValueError):
+    """
+    Raised for an invalid spec. The message starts with the location of the
+    offending entry, e.g. `tasks[3].containers[0].image`.
+    """
+
+
+def _yaml():
+    import yaml
+
+    return yaml, getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _toml():
+    try:
+        import tomllib
+    except ImportError:  # python < 3.11
+        import tomli as tomllib
+    return tomllib
+
+
+def read_documents(path: str) -> Iterator[dict]:
+    """
+    Yield the documents of a spec file one by one.
+    Parsers are only imported for the formats that need them.
+    """
+    extension = os.path.splitext(path)[1]
+    if extension == ".toml":
+        with open(path, "rb") as f:
+            yield _toml().load(f)
+    elif extension == ".json":
+        with open(path) as f:
+            yield json.load(f)
+    elif extension == ".jsonl":
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        yaml, loader = _yaml()
+        with open(path) as f:
+            for document in yaml.load_all(f, Loader=loader):
+                if document is not None:
+                    yield document
+
+
+def _convert(value, hint, where: str):
+    """
+    Check `value` against a type hint of a `projectdata` field.
+    Lists become tuples and strings are interned, since the same subnets,
+    environments etc. occur in every task.
+    """
+    origin = getattr(hint, "__origin__", None)
+    if origin is Union:
+        # Optional fields
+        hint = next(arg for arg in hint.__args__ if arg is not type(None))
+        if value is None:
+            return None
+        return _convert(value, hint, where)
+    if origin in (list, tuple):
+        if not isinstance(value, (list, tuple)):
+            raise SpecError(f"{where}: expected a list, got {value!r}")
+        item_hint = hint.__args__[0]
+        return tuple(
+            _convert(item, item_hint, f"{where}[{i}]") for i, item in enumerate(value)
+        )
+    if isinstance(hint, type) and issubclass(hint, IntEnum):
+        if isinstance(value, hint):
+            return value
+        try:
+            return hint[value]
+        except KeyError:
+            raise SpecError(
+                f"{where}: expected one of {', '.join(hint.__members__)}, got {value!r}"
+            ) from None
+    if hint is str:
+        if not isinstance(value, str):
+            raise SpecError(f"{where}: expected a string, got {value!r}")
+        return sys.intern(value)
+    if hint is int:
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise SpecError(f"{where}: expected an integer, got {value!r}")
+        return value
+    if hint is bool:
+        if not isinstance(value, bool):
+            raise SpecError(f"{where}: expected true or false, got {value!r}")
+        return value
+    # nested model objects are built by the caller
+    return value
+
+
+def build(cls, spec: dict, where: str, **computed):
+    """
+    Create a `projectdata` object from a mapping, checking for unknown and
+    missing fields and for wrong types. `computed` fields are not checked.
+    """
+    if not isinstance(spec, dict):
+        raise SpecError(f"{where}: expected a mapping, got {spec!r}")
+    fields = {field.name: field for field in dataclasses.fields(cls)}
+    unknown = set(spec) - set(fields)
+    if unknown:
+        raise SpecError(f"{where}: unknown field(s) {', '.join(sorted(unknown))}")
+    missing = [
+        name
+        for name, field in fields.items()
+        if name not in spec
+        and name not in computed
+        and field.default is dataclasses.MISSING
+        and field.default_factory is dataclasses.MISSING
+    ]
+    if missing:
+        raise SpecError(f"{where}: missing field(s) {', '.join(missing)}")
+    hints = get_type_hints(cls)
+    values = {
+        name: _convert(value, hints[name], f"{where}.{name}")
+        for name, value in spec.items()
+        if name not in computed
+    }
+    try:
+        return cls(**values, **computed)
+    except ValueError as e:
+        # checks of the model objects themselves
+        raise SpecError(f"{where}: {e}") from None
+
+
+class SpecLoader:
+    """
+    Turns the task entries of a spec into `projectdata` objects
+    """
+
+    def __init__(
+        self,
+        config: ProjectConfig,
+        defaults: dict = None,
+        images=None,
+        check_sizes: bool = True,
+    ):
+        self.config = config
+        self.check_sizes = check_sizes
+        self.defaults = dict(defaults or {})
+        self.images = dict(images or {})
+        self._interned = {}
+        self._seen = set()
+
+    def image(self, spec, environment: str, where: str) -> DockerImage:
+        if isinstance(spec, str):
+            if spec not in self.images:
+                raise SpecError(f"{where}: unknown image {spec!r}")
+            spec = dict(self.images[spec], name=spec)
+        spec = dict({"environment": environment}, **spec)
+        spec.setdefault("ecr_endpoint", self.config.ecr_endpoint)
+        image = build(DockerImage, spec, where)
+        return self._interned.setdefault(image, image)
+
+    def task(self, spec: dict, where: str) -> EcsTask:
+        if not isinstance(spec, dict):
+            raise SpecError(f"{where}: expected a mapping, got {spec!r}")
+        spec = dict(self.defaults, **spec)
+        spec.setdefault("region", self.config.region)
+        for name in ["name", "environment", "containers"]:
+            if name not in spec:
+                raise SpecError(f"{where}: missing field(s) {name}")
+
+        key = (spec["name"], spec["environment"])
+        if key in self._seen:
+            raise SpecError(f"{where}: duplicate task {key[0]} in {key[1]}")
+        self._seen.add(key)
+
+        containers = spec.pop("containers")
+        if not isinstance(containers, list) or not containers:
+            raise SpecError(f"{where}.containers: expected a non-empty list")
+        deployments = []
+        for i, container in enumerate(containers):
+            container_where = f"{where}.containers[{i}]"
+            if not isinstance(container, dict) or "image" not in container:
+                raise SpecError(f"{container_where}: expected a mapping with an image")
+            image = self.image(
+                container["image"], spec["environment"], f"{container_where}.image"
+            )
+            deployments.append(
+                build(
+                    ContainerDeployment,
+                    container,
+                    container_where,
+                    image=image,
+                    task_name=spec["name"],
+                )
+            )
+
+        task_type = _convert(spec.pop("type", "scheduled"), TaskType, f"{where}.type")
+        task_cls, pipeline_cls = TASK_TYPES[task_type]
+        computed = {"container_deployments": tuple(deployments)}
+        nested = {"pipeline": pipeline_cls}
+        if task_type == TaskType.service:
+            nested.update(autoscaling=Autoscaling, load_balancer=LoadBalancer)
+        for name, cls in nested.items():
+            value = spec.pop(name, None)
+            if value is not None:
+                computed[name] = build(cls, value, f"{where}.{name}")
+        task = build(task_cls, spec, where, **computed)
+        problem = self.check_sizes and check_size(task.cpu, task.memory)
+        if problem:
+            raise SpecError(f"{where}: {problem}")
+        return task
+
+
+def _header(
+    document: dict, path: str, check_sizes: bool = True
+) -> Tuple[ProjectConfig, dict, SpecLoader]:
+    if not isinstance(document, dict) or "config" not in document:
+        raise SpecError(f"{path}: the first document must have a config section")
+    unknown = set(document) - HEADER_KEYS
+    if unknown:
+        raise SpecError(f"{path}: unknown section(s) {', '.join(sorted(unknown))}")
+    config = build(ProjectConfig, document["config"], "config")
+    loader = SpecLoader(
+        config,
+        defaults=document.get("defaults"),
+        images=document.get("images"),
+        check_sizes=check_sizes,
+    )
+    return config, dict(document.get("project") or {}), loader
+
+
+def iter_tasks(loader: SpecLoader, header: dict, documents) -> Iterator[EcsTask]:
+    i = 0
+    for spec in header.get("tasks") or []:
+        yield loader.task(spec, f"tasks[{i}]")
+        i += 1
+    for document in documents:
+        specs = document.get("tasks", []) if "tasks" in document else [document]
+        for spec in specs:
+            yield loader.task(spec, f"tasks[{i}]")
+            i += 1
+
+
+def load_project(path: str, check_sizes: bool = True, **options):
+    """
+    Create a `Project` from a spec file. `options` override the `project` section.
+    With `check_sizes`, tasks must have a legal Fargate cpu and memory.
+    """
+    from .project import Project
+
+    documents = read_documents(path)
+    header = next(documents, None)
+    if header is None:
+        raise SpecError(f"{path}: empty spec")
+    config, project_options, loader = _header(header, path, check_sizes)
+    tasks = tuple(iter_tasks(loader, header, documents))
+    return build(
+        Project, dict(project_options, **options), "project", config=config, tasks=tasks
+    )
@@ -1,176 +1,123 @@
-from jinja2 import Template
-
-dockerfile_template = Template(
-    """
-FROM python:{{ image.python_version }}
-
-RUN apt-get update
-
-RUN mkdir -p /workdir
-WORKDIR /workdir
-
-RUN mkdir -p data/
-
-# upgrade pip and install python requirements
-RUN pip install --upgrade pip
-RUN pip install --upgrade pipenv
-
-COPY {{ image.name }}/Pipfile /workdir/
-COPY {{ image.name }}/Pipfile.lock /workdir/
-
-RUN pipenv install --ignore-pipfile --deploy --system
-
-RUN mkdir -p services/{{ image.name }}
-
-# VOLUME /workdir/{{ volume_name }}
-
-# copy app files
-COPY {{ image.name }}/*.py services/{{ image.name }}/
-COPY modules services/modules
+import os
+import time
+from collections import defaultdict
+from typing import Iterable
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "files", "templates")
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "fargatebootstrap",
+    "jinja",
+)
 
-LABEL maintainer = "Halfdan Rump <halfdan.rump@vuzz.com>"
-LABEL org.label-schema.description = "{{ image.description }}"
-LABEL org.label-schema.name = "{{ image.name }}"
+# Names the templates had when they were module level `Template` objects
+TEMPLATE_FILES = {
+    "dockerfile_template": "Dockerfile.j2",
+    # Multi-stage variant of `Dockerfile.j2`. Dependencies are installed into
+    # a virtualenv in a full image, using BuildKit cache mounts, and only the
+    # virtualenv and the sources are copied into a slim runtime image.
+    "optimized_dockerfile_template": "Dockerfile-optimized.j2",
+    # Project-level image with the pip/pipenv bootstrap, the shared packages
+    # and `modules/`. Built once and used as the base of `Dockerfile-service.j2`.
+    "base_dockerfile_template": "Dockerfile-base.j2",
+    "service_dockerfile_template": "Dockerfile-service.j2",
+    # Read by BuildKit next to the Dockerfile, limits the build context to
+    # the image's folder and `modules/`
+    "dockerignore_template": "dockerignore.j2",
+    "base_image_repository_template": "base_image_repository.tf.j2",
+    "pipfile_template": "Pipfile.j2",
+    "python_batch_script": "batch_script.py.j2",
+    "asyncio_batch_script": "batch_script_asyncio.py.j2",
+    "process_pool_batch_script": "batch_script_process_pool.py.j2",
+    "makefile_template": "Makefile.j2",
+    "scheduled_task_template": "scheduled_task.tf.j2",
+    # All scheduled tasks of a Terraform state as one `for_each` module
+    "scheduled_tasks_template": "scheduled_tasks.tf.j2",
+    "ecs_service_template": "ecs_service.tf.j2",
+}
 
-#CMD python -c 'while True: pass'
-#ENTRYPOINT ["python", "-m"]
-CMD python -m services.{{ image.name }}.{{ image.script_name }}
-"""
-)
 
-pipfile_template = Template(
+class CountingBytecodeCache(FileSystemBytecodeCache):
+    """
+    Bytecode cache that counts how many templates had to be compiled
     """
-[[source]]
-url = "https://pypi.org/simple"
-verify_ssl = true
-name = "pypi"
-
-[packages]
-PyYAML = "==3.13"
-sentry-sdk = "==0.7.14"
-slack_logger = "==0.3.1"
-progressbar2 = "==3.42.0"
-
-[requires]
-python_version = "{{ python_version }}"
-"""
-)
 
-python_batch_script = Template(
+    def __init__(self, directory: str):
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            # let jinja fall back to a folder in the temp dir
+            directory = None
+        super().__init__(directory)
+        self.hits = 0
+        self.misses = 0
+
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        if bucket.code is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+
+class TemplateLoader:
     """
-from sentry_sdk import capture_exception
-from sentry_sdk import init as init_sentry
-
-from ..modules.config import load_config
-from ..modules.logger import Logger, LoggerName
-
-
-def main():
-    raise NotImplementedError("You must implement this.")
-
-if __name__ == "__main__":
-    config = load_config(folder_name="{{ image.name }})"
-    init_sentry(config["sentry_dsn"])
-    try:
-        logger = Logger(config=config["logging"], default_loggers=[LoggerName.stdout])
-        logger.info("running {{ image.name }} ")
-        main()
-        logger.info("done")
-    except Exception as e:
-        # send error to sentry
-        capture_exception(e)
-
-        # send error to slack
-        logger.error(e, LoggerName.slack)
-"""
-)
+    Loads the templates in `files/templates` through a Jinja `Environment`.
 
-makefile_template = Template(
+    Compiled templates are kept in an on-disk bytecode cache, so that they are
+    not compiled again on the next run. A template with the same file name in
+    one of the override folders takes precedence over the bundled one.
     """
-lock_dependencies:
-{%- for task in tasks %}
-{%- for deployment in task.container_deployments %}
-\t\tcd containers/{{ deployment.image.name }} && pipenv install
-{% endfor -%}
-{% endfor -%}
 
-build_docker:
-{%- for task in tasks %}
-\t\tdocker-compose -f docker-compose-{{ task.name }}-{{ task.environment }}.yml build
-{% endfor -%}
+    def __init__(self, override_dirs: Iterable[str] = (), cache_dir: str = CACHE_DIR):
+        self.bytecode_cache = CountingBytecodeCache(cache_dir)
+        self.environment = Environment(bytecode_cache=self.bytecode_cache)
+        self.set_override_dirs(override_dirs)
+        self.renders = defaultdict(int)
+        self.render_seconds = defaultdict(float)
 
-{%- for task in tasks %}
-{%- for deployment in task.container_deployments %}
-run_{{ deployment.image.name }}:
-\t\tpython -m containers.{{ deployment.image.name }}.{{ deployment.image.script_name}}
-{% endfor -%}
-{% endfor -%}
+    def set_override_dirs(self, override_dirs: Iterable[str]):
+        self.override_dirs = tuple(override_dirs)
+        self.environment.loader = FileSystemLoader(
+            list(self.override_dirs) + [TEMPLATE_DIR]
+        )
 
+    def get(self, name: str) -> Template:
+        return self.environment.get_template(name)
 
+    def render(self, name: str, **context) -> str:
+        template = self.get(name)
+        start = time.perf_counter()
+        rendered = template.render(**context)
+        self.render_seconds[name] += time.perf_counter() - start
+        self.renders[name] += 1
+        return rendered
 
-tfinit:
-\t\tcd terraform && terraform init
+    @property
+    def stats(self) -> dict:
+        return {
+            "compiled": self.bytecode_cache.misses,
+            "bytecode_cache_hits": self.bytecode_cache.hits,
+            "templates": {
+                name: {"renders": count, "seconds": self.render_seconds[name]}
+                for name, count in sorted(self.renders.items())
+            },
+        }
 
-tfapply:
-\t\tcd terraform && terraform apply
-"""
-)
 
-scheduled_task_template = Template(
-    """
-variable "{{ task.name }}_{{ task.environment }}_log_groups" {
-  description = "Map from service name to log group name"
-  default     = {
-    {% for deployment in task.container_deployments -%}
-    "{{ deployment.image.name }}" = "{{ deployment.awslogs_group }}"
-    {% endfor -%}
-  }
-}
+loader = TemplateLoader()
 
 
+def render(name: str, **context) -> str:
+    return loader.render(name, **context)
 
-module "fargate-scheduled-{{ task.name }}-{{ task.environment }}" {
-    source                = "halfdanrump/fargate-scheduled-task-multicontainer/aws"
-    version               = "12.6.1"
-    account_id            = "{{ project_config.account_id }}"
-    name                  = "{{ task.name }}"
-    environment           = "{{ task.environment }}"
-    log_groups            = var.{{ task.name }}_{{ task.environment }}_log_groups
-    network_mode          = "awsvpc"
-    assign_public_ip      = true
-    launch_type           = "FARGATE"
-    container_definitions = "${file("{{ container_definitions_filename }}")}"
-    schedule_expression   = "{{ schedule_expression }}"
-    cluster_arn           = "{{ project_config.ecs_cluster_arn }}"
-    memory                = "{{ task.memory }}"
-    cpu                   = "{{ task.cpu }}"
-    subnets               = {{ subnets }}
-    security_groups       = {{ security_groups }}
 
-}
-
-### aws codepipeline CICD
-{% if task.pipeline != None %}
-module "conterec_production_cicd" {
-  source                     = "halfdanrump/codepipeline-dockerbuild/aws"
-  version                    = "12.6.3"
-  name                       = "{{ task.name }}"
-  account_id                 = "{{ project_config.account_id }}"
-  environment                = "{{ task.environment }}"
-  github_webhook_token       = "${var.github_webhook_token}"
-  git_repo                   = "{{ project_config.git_repo_name }}"
-  git_branch                 = "{{ project_config.git_repo_branch }}"
-  dockerbuild_image          = "aws/codebuild/docker:18.09.0"
-  dockerbuild_timeout        = "15"
-  dockerbuild_buildspec_path = "buildspec/buildspec-dockerbuild-{{ task.name }}-{{ task.environment }}.yml"
-  unittest_buildspec_path    = "buildspec/buildspec-unittest-{{ task.name }}-allenvs.yml"
-  unittest_security_groups   = {{ unittest_security_groups }}
-  unittest_subnets           = {{ unittest_subnets }}
-  unittest_vpc               = "{{ project_config.vpc_name }}"
-  unittest_image             = "aws/codebuild/python:3.6.5"
-  unittest_timeout           = 15
-}
-{% endif %}
-"""
-    # TODO Split CICD into a different FileClass
-)
+def __getattr__(name):
+    """
+    Keep `from fargatebootstrap.templates import dockerfile_template` working
+    """
+    if name in TEMPLATE_FILES:
+        return loader.get(TEMPLATE_FILES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,63 @@
+import pytest
+
+from fargatebootstrap.project import Project
+from fargatebootstrap.projectdata import (
+    ContainerDeployment,
+    DockerbuildPipeline,
+    DockerImage,
+    EcsScheduledTask,
+    ProjectConfig,
+)
+
+
+@pytest.fixture
+def make_project():
+    """
+    A project of `n_tasks` scheduled tasks, each with an image of its own and
+    an image shared by all tasks
+    """
+
+    def make_project(n_tasks: int = 3, **options) -> Project:
+        config = ProjectConfig(
+            account_id="123456789012",
+            region="ap-northeast-1",
+            vpc_name="vpc_test",
+            ecs_cluster_name="test-cluster",
+            git_repo_name="test",
+            git_repo_branch="master",
+        )
+        pipeline = DockerbuildPipeline(
+            unittest_subnets=("subnet1",), unittest_security_groups=("sg1",)
+        )
+
+        def image(name):
+            return DockerImage(
+                name=name,
+                environment="production",
+                description=f"Runs {name}",
+                script_name="main",
+                ecr_endpoint=config.ecr_endpoint,
+            )
+
+        shared = image("shared")
+        tasks = tuple(
+            EcsScheduledTask(
+                name=f"task{i}",
+                environment="production",
+                cpu=512,
+                memory=2048,
+                region=config.region,
+                container_deployments=(
+                    ContainerDeployment(task_name=f"task{i}", image=image(f"image{i}")),
+                    ContainerDeployment(task_name=f"task{i}", image=shared),
+                ),
+                subnets=("subnet1", "subnet2"),
+                security_groups=("sg1",),
+                schedule_expression="rate(1 hour)",
+                pipeline=pipeline,
+            )
+            for i in range(n_tasks)
+        )
+        return Project(config=config, tasks=tasks, **options)
+
+    return make_project
@@ -0,0 +1,86 @@
+import json
+import os
+
+import pytest
+
+from fargatebootstrap.build import (
+    BUILT,
+    SKIPPED,
+    BuildOrchestrator,
+    image_build_jobs,
+)
+from fargatebootstrap.projectdata import unique_images
+
+
+@pytest.fixture
+def bootstrapped(make_project, tmp_path, monkeypatch):
+    def bootstrapped(**options):
+        monkeypatch.chdir(tmp_path)
+        project = make_project(3, **options)
+        project.copy_files()
+        project.make_files()
+        return project
+
+    return bootstrapped
+
+
+def statuses(results) -> dict:
+    return {result.name: result.status for result in results}
+
+
+def run(project, state_dir):
+    jobs = image_build_jobs(
+        unique_images(project.tasks),
+        build_command="echo {name}",
+        base_image=project.base_image,
+    )
+    return statuses(BuildOrchestrator(jobs, state_dir=state_dir).run())
+
+
+def test_unchanged_images_are_skipped(bootstrapped, tmp_path):
+    project = bootstrapped()
+    state_dir = str(tmp_path / "state")
+    names = ["image0", "shared", "image1", "image2"]
+    assert run(project, state_dir) == {name: BUILT for name in names}
+    assert run(project, state_dir) == {name: SKIPPED for name in names}
+
+    with open("containers/image1/main.py", "a") as f:
+        f.write("\n# changed\n")
+    assert run(project, state_dir) == {
+        "image0": SKIPPED,
+        "shared": SKIPPED,
+        "image1": BUILT,
+        "image2": SKIPPED,
+    }
+
+
+def test_images_are_rebuilt_with_their_base(bootstrapped, tmp_path):
+    project = bootstrapped(shared_base_image=True)
+    state_dir = str(tmp_path / "state")
+    run(project, state_dir)
+
+    with open("containers/base/Pipfile", "a") as f:
+        f.write("\n# changed\n")
+    assert set(run(project, state_dir).values()) == {BUILT}
+
+
+def test_project_build_with_fake_commands(bootstrapped):
+    project = bootstrapped()
+    options = dict(
+        build_command="echo {name}", lock_command="touch {folder}/Pipfile.lock"
+    )
+    project.build(**options)
+    project.build(**options)
+    with open(os.path.join(".fargatebootstrap-build", "report.json")) as f:
+        report = json.load(f)
+    assert {result["name"] for result in report} == {
+        "lock_image0",
+        "lock_shared",
+        "lock_image1",
+        "lock_image2",
+        "image0",
+        "shared",
+        "image1",
+        "image2",
+    }
+    assert {result["status"] for result in report} == {SKIPPED}
@@ -0,0 +1,63 @@
+import os
+from dataclasses import replace
+
+import pytest
+
+from fargatebootstrap.projectdata import DockerfileMode
+
+
+def read_tree(root: str) -> dict:
+    tree = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != "__pycache__"]
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            with open(path, "rb") as f:
+                tree[os.path.relpath(path, root)] = f.read()
+    return tree
+
+
+def generate(project, folder, monkeypatch) -> dict:
+    os.makedirs(folder)
+    monkeypatch.chdir(folder)
+    project.make_files()
+    return read_tree(str(folder))
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_parallel_output_is_identical_to_serial(
+    make_project, tmp_path, monkeypatch, executor
+):
+    serial = generate(make_project(10), tmp_path / "serial", monkeypatch)
+    parallel = generate(
+        make_project(10, workers=4, executor=executor),
+        tmp_path / executor,
+        monkeypatch,
+    )
+    assert serial
+    assert parallel == serial
+
+
+def test_no_base_image_without_images_built_on_it(
+    make_project, tmp_path, monkeypatch
+):
+    project = make_project(2, shared_base_image=True)
+    project.tasks = tuple(
+        replace(
+            task,
+            container_deployments=tuple(
+                replace(
+                    deployment,
+                    image=replace(
+                        deployment.image, dockerfile_mode=DockerfileMode.optimized
+                    ),
+                )
+                for deployment in task.container_deployments
+            ),
+        )
+        for task in project.tasks
+    )
+    assert project.base_image is None
+    tree = generate(project, tmp_path / "optimized", monkeypatch)
+    base = os.path.join("containers", "base")
+    assert not any(path.startswith(base) for path in tree)
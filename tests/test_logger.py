@@ -0,0 +1,94 @@
+import importlib.util
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+pytest.importorskip("progressbar")
+
+LOGGER_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "fargatebootstrap",
+    "files",
+    "modules",
+    "logger.py",
+)
+
+
+@pytest.fixture(scope="module")
+def logger_module():
+    """
+    The logger module of the containers, which is not part of the package
+    """
+    spec = importlib.util.spec_from_file_location("container_logger", LOGGER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def slack():
+    """
+    A local stand-in for the Slack webhook, collecting the posted payloads
+    """
+    posts = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            posts.append(json.loads(self.rfile.read(length)))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/", posts
+    server.shutdown()
+    server.server_close()
+
+
+def record(message, lineno=10, level=logging.ERROR):
+    return logging.LogRecord("test", level, "job.py", lineno, message, (), None)
+
+
+def test_identical_records_are_batched_into_one_line(logger_module, slack):
+    url, posts = slack
+    handler = logger_module.BatchingSlackHandler(url, batch_size=100)
+    for _ in range(50):
+        handler.emit(record("boom"))
+    handler.emit(record("other", lineno=20))
+    handler.close()
+
+    assert len(posts) == 1
+    lines = posts[0]["text"].splitlines()
+    assert len(lines) == 2
+    assert lines[0].startswith("boom (x50, ")
+    assert lines[1] == "other"
+
+
+def test_records_are_posted_in_batches(logger_module, slack):
+    url, posts = slack
+    handler = logger_module.BatchingSlackHandler(url, batch_size=5)
+    for i in range(10):
+        handler.emit(record(f"message {i}"))
+    handler.close()
+
+    assert len(posts) == 2
+    assert [len(post["text"].splitlines()) for post in posts] == [5, 5]
+
+
+def test_dropped_records_are_reported(logger_module, slack):
+    url, posts = slack
+    handler = logger_module.BatchingSlackHandler(url)
+    handler.dropped = 3
+    handler.emit(record("boom"))
+    handler.close()
+
+    assert posts[0]["text"].splitlines() == ["boom", "(3 messages dropped)"]